@@ -0,0 +1,211 @@
+import time
+import numpy as np
+
+from draw_analemma import solve_analemma, solve_analemma_grid
+
+# An atlas tabulates the exact analemma, i.e. the unnormalized Planet-Sun
+# vector (x1, x2, x3), over a regular (eps, ecc, g) grid. Each grid node
+# stores the first Fourier coefficients in the mean anomaly M of the three
+# coordinates. A lookup interpolates the coefficients multilinearly (g being
+# periodic) and sums the series.
+#
+# Binary layout of an atlas file:
+#   - HEADER (fixed size record)
+#   - coefs, complex64 array of shape (n_eps, n_ecc, n_g, 3, n_harm + 1)
+MAGIC = b"ANLATLAS"
+VERSION = 1
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("n_harm", "<u4"),
+        ("n_samples", "<u8"),
+        ("n_eps", "<u8"),
+        ("n_ecc", "<u8"),
+        ("n_g", "<u8"),
+        ("eps_min", "<f8"),
+        ("eps_max", "<f8"),
+        ("ecc_min", "<f8"),
+        ("ecc_max", "<f8"),
+        ("offset", "<f8"),
+        ("error", "<f8"),
+    ]
+)
+# Safety factor of the error measured at the cell centers, which are not
+# always the worst points of a cell
+ATLAS_ERROR_MARGIN = 1.5
+
+
+def build_atlas(
+    n_eps=19, n_ecc=11, n_g=72, eps_max=np.pi / 2, ecc_max=0.5, n_harm=48,
+    n_samples=256, offset=0.0, margin=ATLAS_ERROR_MARGIN,
+):
+    """ Tabulate the exact analemma over a regular (eps, ecc, g) grid.
+    Args:
+        n_eps, n_ecc, n_g (int, optional): number of nodes along each axis,
+            g spans [0, 2pi) and is periodic
+        eps_max (float, optional): largest obliquity, in radians
+        ecc_max (float, optional): largest eccentricity
+        n_harm (int, optional): number of harmonics kept in M
+        n_samples (int, optional): samples in M used for the transform
+        offset (float, optional): Winter solstice to year start in [0, 1)
+        margin (float, optional): safety factor of the error, see atlas_error
+
+    Returns:
+        atlas (dict): header fields and the "coefs" array. The "error" field
+            is the largest distance between the atlas and solve_analemma
+            over all cell centers, times `margin`. It is an empirical bound
+            for the parameters inside the grid, not a proven one.
+    """
+    assert n_samples >= 2 * n_harm + 1
+    eps = np.linspace(0.0, eps_max, n_eps)
+    ecc = np.linspace(0.0, ecc_max, n_ecc)
+    g = np.linspace(0.0, 2 * np.pi, n_g, endpoint=False)
+    M = np.linspace(0.0, 2 * np.pi, n_samples, endpoint=False)
+
+    coefs = np.empty((n_eps, n_ecc, n_g, 3, n_harm + 1), dtype=np.complex64)
+    for i in range(n_eps):
+        xs = solve_analemma_grid(eps[i], ecc, g, M, offset=offset)
+        for k, x in enumerate(xs):
+            c = np.fft.rfft(x[0], axis=-1)[..., :n_harm + 1] / n_samples
+            c[..., 1:] *= 2.0
+            coefs[i, :, :, k] = c
+
+    atlas = dict(
+        n_harm=n_harm, n_samples=n_samples, n_eps=n_eps, n_ecc=n_ecc,
+        n_g=n_g, eps_min=0.0, eps_max=eps_max, ecc_min=0.0, ecc_max=ecc_max,
+        offset=offset, error=np.nan, coefs=coefs,
+    )
+    atlas["error"] = atlas_error(atlas, margin)
+    return atlas
+
+
+def atlas_error(atlas, margin=ATLAS_ERROR_MARGIN):
+    """ Largest error of the atlas against solve_analemma over all cell
+    centers, where multilinear interpolation is least accurate, on
+    4 * n_harm samples in M, times a safety margin for the points away
+    from the centers and between the samples.
+    """
+    n_eps, n_ecc, n_g = atlas["n_eps"], atlas["n_ecc"], atlas["n_g"]
+    d_eps = (atlas["eps_max"] - atlas["eps_min"]) / (n_eps - 1)
+    d_ecc = (atlas["ecc_max"] - atlas["ecc_min"]) / (n_ecc - 1)
+    ecc = atlas["ecc_min"] + (np.arange(n_ecc - 1) + 0.5) * d_ecc
+    g = (np.arange(n_g) + 0.5) * 2 * np.pi / n_g
+    M = np.linspace(0.0, 2 * np.pi, 4 * atlas["n_harm"], endpoint=False)
+    harmonics = np.exp(1j * np.multiply.outer(M, np.arange(atlas["n_harm"] + 1)))
+
+    error = 0.0
+    for i in range(n_eps - 1):
+        eps = atlas["eps_min"] + (i + 0.5) * d_eps
+        exact = solve_analemma_grid(eps, ecc, g, M, offset=atlas["offset"])
+        # Interpolation at the centers: mean of the 8 nodes of each cell
+        c = np.asarray(atlas["coefs"][i:i + 2], dtype=np.complex128).mean(axis=0)
+        c = 0.5 * (c[:-1] + c[1:])
+        c = 0.5 * (c + np.roll(c, -1, axis=1))
+        approx = np.real(c @ harmonics.T)  # (n_ecc - 1, n_g, 3, n_M)
+        dist = np.sqrt(sum((x[0] - approx[:, :, k]) ** 2 for k, x in enumerate(exact)))
+        error = max(error, float(np.amax(dist)))
+    return margin * error
+
+
+def lookup_coefs(atlas, eps, ecc, g):
+    """ Interpolated Fourier coefficients, shape (3, n_harm + 1).
+    """
+    n_eps, n_ecc, n_g = atlas["n_eps"], atlas["n_ecc"], atlas["n_g"]
+    u = (eps - atlas["eps_min"]) / (atlas["eps_max"] - atlas["eps_min"])
+    v = (ecc - atlas["ecc_min"]) / (atlas["ecc_max"] - atlas["ecc_min"])
+    assert 0.0 <= u <= 1.0 and 0.0 <= v <= 1.0, "parameters outside atlas"
+    u, v, w = u * (n_eps - 1), v * (n_ecc - 1), (g % (2 * np.pi)) / (2 * np.pi) * n_g
+
+    i, j, k = min(int(u), n_eps - 2), min(int(v), n_ecc - 2), int(w) % n_g
+    fu, fv, fw = u - i, v - j, w - int(w)
+    k1 = (k + 1) % n_g
+    c = atlas["coefs"]
+    c_ij = (
+        (1 - fu) * (1 - fv) * ((1 - fw) * c[i, j, k] + fw * c[i, j, k1])
+        + (1 - fu) * fv * ((1 - fw) * c[i, j + 1, k] + fw * c[i, j + 1, k1])
+        + fu * (1 - fv) * ((1 - fw) * c[i + 1, j, k] + fw * c[i + 1, j, k1])
+        + fu * fv * ((1 - fw) * c[i + 1, j + 1, k] + fw * c[i + 1, j + 1, k1])
+    )
+    return c_ij
+
+
+def lookup(atlas, eps, ecc, g, M):
+    """ Approximate solve_analemma(eps, ecc, g, M) from the atlas.
+    Args:
+        atlas (dict): atlas from build_atlas or load_atlas
+        eps, ecc, g (float): obliquity, eccentricity and phase, in radians
+        M (np.ndarray): mean anomalies, in radians
+
+    Returns:
+        x1, x2, x3 (np.ndarray): Planet-Sun vector in planet-centric coords,
+            within atlas["error"] of solve_analemma, see build_atlas.
+    """
+    c = lookup_coefs(atlas, eps, ecc, g).astype(np.complex128)
+    M = np.asarray(M, dtype=float)
+    harmonics = np.exp(1j * np.multiply.outer(M, np.arange(c.shape[1])))
+    x = np.real(harmonics @ c.T)
+    return x[..., 0], x[..., 1], x[..., 2]
+
+
+def lookup_uniform(atlas, eps, ecc, g, n):
+    """ lookup at the n uniform mean anomalies 2pi k / n, k < n, evaluated
+    with an FFT.
+    """
+    if not isinstance(n, (int, np.integer)) or n < 1:
+        raise TypeError("n must be a positive integer number of samples")
+    c = lookup_coefs(atlas, eps, ecc, g).astype(np.complex128)
+    full = np.zeros((3, n // 2 + 1), dtype=np.complex128)
+    h = min(c.shape[1], n // 2 + 1)
+    full[:, :h] = c[:, :h]
+    full[:, 1:] /= 2.0
+    x = np.fft.irfft(full * n, n=n, axis=-1)
+    return x[0], x[1], x[2]
+
+
+def save_atlas(filename, atlas):
+    header = np.zeros((), dtype=HEADER)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    for name in HEADER.names[2:]:
+        header[name] = atlas[name]
+    with open(filename, "wb") as f:
+        f.write(header.tobytes())
+        np.ascontiguousarray(atlas["coefs"], dtype="<c8").tofile(f)
+    return
+
+
+def load_atlas(filename, mmap=False):
+    raw = np.fromfile(filename, dtype=HEADER, count=1)[0]
+    if raw["magic"] != MAGIC or raw["version"] != VERSION:
+        raise ValueError(f"{filename} is not an analemma atlas")
+    atlas = {name: raw[name].item() for name in HEADER.names[2:]}
+    shape = (
+        atlas["n_eps"], atlas["n_ecc"], atlas["n_g"], 3, atlas["n_harm"] + 1
+    )
+    if mmap:
+        atlas["coefs"] = np.memmap(
+            filename, dtype="<c8", mode="r", offset=HEADER.itemsize, shape=shape
+        )
+    else:
+        atlas["coefs"] = np.fromfile(
+            filename, dtype="<c8", offset=HEADER.itemsize
+        ).reshape(shape)
+    return atlas
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    atlas = build_atlas()
+    print(f"Built atlas in {time.perf_counter() - start:.2f} s")
+    print(f"Interpolation error bound (with margin): {atlas['error']:.3e}")
+    save_atlas("./Analemma/analemma_atlas.bin", atlas)
+
+    atlas = load_atlas("./Analemma/analemma_atlas.bin")
+    M = np.linspace(0.0, 2 * np.pi, 2401)
+    n_calls = 1000
+    start = time.perf_counter()
+    for _ in range(n_calls):
+        lookup_coefs(atlas, np.deg2rad(23.44), 0.0167, np.deg2rad(12.93))
+    elapsed = (time.perf_counter() - start) / n_calls
+    print(f"Coefficient lookup: {1e6 * elapsed:.1f} us per call")
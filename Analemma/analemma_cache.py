@@ -0,0 +1,101 @@
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+
+class AnalemmaCache:
+    """ Memoize analemma solvers on their arguments.
+
+    Results are kept in an in-memory LRU tier bounded by `max_bytes`, and
+    optionally in an on-disk tier (one .npz file per entry) under `path`.
+    Cached arrays are copied on the way out, since callers such as
+    project_analemma modify them in place. Solvers (and function arguments)
+    are keyed by name, so they must be module-level functions.
+    """
+
+    def __init__(self, max_bytes=256 * 2**20, path=None):
+        self.max_bytes = max_bytes
+        self.path = path
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    def get(self, solver, *args, **kwargs):
+        key = _make_key(solver, args, kwargs)
+        arrays = self._entries.get(key)
+        if arrays is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return tuple(np.copy(x) for x in arrays)
+
+        filename = self._filename(key)
+        if filename and os.path.exists(filename):
+            with np.load(filename) as data:
+                arrays = tuple(data[f"arr_{i}"] for i in range(len(data.files)))
+            self.hits += 1
+        else:
+            arrays = tuple(np.asarray(x) for x in solver(*args, **kwargs))
+            if filename:
+                np.savez(filename, *arrays)
+            self.misses += 1
+
+        self._insert(key, arrays)
+        return tuple(np.copy(x) for x in arrays)
+
+    def clear(self, disk=False):
+        self._entries.clear()
+        self.n_bytes = 0
+        if disk and self.path:
+            for name in os.listdir(self.path):
+                if name.endswith(".npz"):
+                    os.remove(os.path.join(self.path, name))
+        return
+
+    def _insert(self, key, arrays):
+        size = sum(x.nbytes for x in arrays)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = arrays
+        self.n_bytes += size
+        while self.n_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.n_bytes -= sum(x.nbytes for x in evicted)
+        return
+
+    def _filename(self, key):
+        if not self.path:
+            return ""
+        digest = hashlib.blake2b(repr(key).encode(), digest_size=16)
+        return os.path.join(self.path, f"{digest.hexdigest()}.npz")
+
+
+def _make_key(solver, args, kwargs):
+    parts = [_function_key(solver)]
+    parts += [_key_part(a) for a in args]
+    parts += [(k, _key_part(v)) for k, v in sorted(kwargs.items())]
+    return tuple(parts)
+
+
+def _function_key(func):
+    # Functions are keyed by name, which only identifies module-level ones:
+    # two lambdas or two closures of the same factory share their name
+    name = f"{func.__module__}.{func.__qualname__}"
+    if "<" in name:
+        raise ValueError(f"cannot cache {name}, use a module-level function")
+    return name
+
+
+def _key_part(a):
+    if callable(a):
+        return _function_key(a)
+    a = np.asarray(a)
+    if a.size == 1:
+        return (a.shape, a.dtype.str, a.item())
+    a = np.ascontiguousarray(a)
+    digest = hashlib.blake2b(a.view(np.uint8), digest_size=16).hexdigest()
+    return (a.shape, a.dtype.str, digest)
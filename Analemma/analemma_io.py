@@ -0,0 +1,102 @@
+import numpy as np
+
+# Binary layout of an analemma file:
+#   - HEADER (fixed size record)
+#   - shifts, float64 array of shape (n_shifts,), in degrees
+#   - frames, array of shape (n_shifts, len(FIELDS), n) and dtype `dtype`
+# Each shift frame is contiguous, so that it can be read on its own.
+MAGIC = b"ANALEMMA"
+VERSION = 1
+FIELDS = (
+    "x_exact", "y_exact", "z_exact", "s_exact",
+    "x_approx", "y_approx", "z_approx", "s_approx",
+)
+HEADER = np.dtype(
+    [
+        ("magic", "S8"),
+        ("version", "<u4"),
+        ("dtype", "S4"),
+        ("n_shifts", "<u8"),
+        ("n", "<u8"),
+        ("n_fields", "<u8"),
+        ("eps", "<f8"),
+        ("ecc", "<f8"),
+    ]
+)
+
+
+def write_header(f, eps, ecc, shifts, n, dtype=np.float32):
+    """ Write the header and the shifts of an analemma file.
+    Args:
+        f (file): binary file opened for writing
+        eps (float): obliquity, in degrees
+        ecc (float): eccentricity
+        shifts (np.ndarray): phase shifts, in degrees
+        n (int): number of samples per analemma
+        dtype (np.dtype, optional): storage type of the frames
+    """
+    shifts = np.asarray(shifts, dtype="<f8")
+    header = np.zeros((), dtype=HEADER)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["dtype"] = np.dtype(dtype).newbyteorder("<").str
+    header["n_shifts"] = shifts.size
+    header["n"] = n
+    header["n_fields"] = len(FIELDS)
+    header["eps"] = eps
+    header["ecc"] = ecc
+    f.write(header.tobytes())
+    f.write(shifts.tobytes())
+    return
+
+
+def write_analemmas(filename, eps, ecc, shifts, frames, dtype=np.float32):
+    """ Write analemma frames of shape (n_shifts, len(FIELDS), n) to a file.
+    """
+    frames = np.ascontiguousarray(frames, dtype=np.dtype(dtype).newbyteorder("<"))
+    n_shifts, n_fields, n = frames.shape
+    assert n_shifts == len(shifts) and n_fields == len(FIELDS)
+    with open(filename, "wb") as f:
+        write_header(f, eps, ecc, shifts, n, dtype)
+        frames.tofile(f)
+    return
+
+
+def read_analemmas(filename, mode="r"):
+    """ Open an analemma file without reading the frames.
+    Args:
+        filename (str): path to the file
+        mode (str, optional): np.memmap mode
+
+    Returns:
+        header (dict): eps, ecc, n_shifts, n and dtype
+        shifts (np.ndarray): phase shifts, in degrees
+        frames (np.memmap): frames of shape (n_shifts, len(FIELDS), n)
+    """
+    raw = np.fromfile(filename, dtype=HEADER, count=1)[0]
+    if raw["magic"] != MAGIC:
+        raise ValueError(f"{filename} is not an analemma file")
+    if raw["version"] != VERSION:
+        raise ValueError(f"Unsupported analemma file version {raw['version']}")
+    header = {name: raw[name].item() for name in HEADER.names}
+    header["dtype"] = np.dtype(header["dtype"].decode())
+    n_shifts, n_fields, n = header["n_shifts"], header["n_fields"], header["n"]
+    shifts = np.fromfile(
+        filename, dtype="<f8", count=n_shifts, offset=HEADER.itemsize
+    )
+    frames = np.memmap(
+        filename,
+        dtype=header["dtype"],
+        mode=mode,
+        offset=HEADER.itemsize + 8 * n_shifts,
+        shape=(n_shifts, n_fields, n),
+    )
+    return header, shifts, frames
+
+
+def read_frame(filename, i):
+    """ Read the i-th shift frame of an analemma file as a dict of arrays.
+    """
+    _, _, frames = read_analemmas(filename)
+    frame = np.array(frames[i])
+    return dict(zip(FIELDS, frame))
@@ -0,0 +1,81 @@
+from math import cos, sin, sqrt, floor, nan, pi
+
+# Compiled kernels for the analemma pipeline. Numba is optional: without it
+# the kernels are plain Python functions, correct but far too slow for
+# anything else than testing, and draw_analemma falls back to NumPy.
+try:
+    from numba import njit, prange
+
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+    prange = range
+
+_ALPHA_0 = 3 * pi * pi / (pi * pi - 6)
+_ALPHA_1 = 1.6 * pi / (pi * pi - 6)
+
+
+def _jit(**options):
+    def decorator(func):
+        return njit(cache=True, **options)(func) if HAS_NUMBA else func
+    return decorator
+
+
+@_jit()
+def _kepler(M, e, tol, max_iter):
+    # Scalar version of kepler.solve_kepler: returns E, and the number of
+    # correction passes, max_iter + 1 if not converged
+    turns = floor(M / (2 * pi) + 0.5)
+    m = M - 2 * pi * turns
+    sign = -1.0 if m < 0.0 else 1.0
+    m = abs(m)
+
+    alpha = _ALPHA_0 + _ALPHA_1 * (pi - m) / (1 + e)
+    d = 3 * (1 - e) + alpha * e
+    q = 2 * alpha * d * (1 - e) - m * m
+    r = 3 * alpha * d * (d - 1 + e) * m + m * m * m
+    w = (abs(r) + sqrt(q * q * q + r * r)) ** (2.0 / 3.0)
+    E = (2 * r * w / (w * w + w * q + q * q) + m) / d
+
+    n_pass = 0
+    while n_pass < max_iter:
+        se, ce = e * sin(E), e * cos(E)
+        f0 = E - se - m
+        f1 = 1 - ce
+        d3 = -f0 / (f1 - 0.5 * f0 * se / f1)
+        d4 = -f0 / (f1 + 0.5 * d3 * se + d3 * d3 * ce / 6)
+        d5 = -f0 / (f1 + 0.5 * d4 * se + d4 * d4 * ce / 6 - d4 * d4 * d4 * se / 24)
+        E += d5
+        n_pass += 1
+        if abs(d5) <= tol:
+            return sign * E + 2 * pi * turns, n_pass
+    return sign * E + 2 * pi * turns, max_iter + 1
+
+
+@_jit(parallel=True)
+def solve_projected(M, e, ce, se, cg, sg, tol, max_iter, mask, x1, x2, x3):
+    """ Unit Planet-Sun vectors for civil mean anomalies M, written to
+    x1, x2, x3, NaN below the horizon if mask. Returns the number of
+    elements where Kepler's equation did not converge.
+    """
+    b = sqrt(1 - e * e)
+    c2g, s2g = cg * cg - sg * sg, 2 * sg * cg
+    n_fail = 0
+    for i in prange(M.size):
+        E, n_pass = _kepler(M[i], e, tol, max_iter)
+        if n_pass > max_iter:
+            n_fail += 1
+        cE, sE = cos(E), sin(E)
+        r = 1 - e * cE
+        P, Q = (cE - e) / r, b * sE / r  # cos(nu), sin(nu)
+        cM, sM = cos(M[i]), sin(M[i])
+        cD, sD = P * cM + Q * sM, Q * cM - P * sM  # nu - M
+        cS, sS = P * cM - Q * sM, Q * cM + P * sM  # nu + M
+        u1 = (1 + ce) / 2 * cD - (1 - ce) / 2 * (c2g * cS - s2g * sS)
+        if mask and u1 <= 0.0:
+            x1[i], x2[i], x3[i] = nan, nan, nan
+            continue
+        x1[i] = u1
+        x2[i] = (1 + ce) / 2 * sD + (1 - ce) / 2 * (c2g * sS + s2g * cS)
+        x3[i] = -se * (cg * P - sg * Q)
+    return n_fail
@@ -1,20 +1,22 @@
 import bpy
 import os
+import sys
 import numpy as np
 
-# Chemin vers votre fichier CSV
+sys.path.append(os.path.expanduser("~/Documents/Math_animations/Analemma"))
+from analemma_io import read_analemmas
+
+# Chemin vers votre fichier binaire (export_analemmas(..., fmt="bin"))
 eps = 35.0
 ecc = 0.1
 path = f"~/Documents/Math_animations/Analemma/data/eps_{eps:02.0f}_ecc_{100*ecc:02.0f}"
-x_filepath = os.path.expanduser(f"{path}_x.txt")
-y_filepath = os.path.expanduser(f"{path}_y.txt")
-z_filepath = os.path.expanduser(f"{path}_z.txt")
-s_filepath = os.path.expanduser(f"{path}_s.txt")
+filepath = os.path.expanduser(f"{path}.bin")
 
-x = np.loadtxt(x_filepath)
-y = np.loadtxt(y_filepath)
-z = np.loadtxt(z_filepath)
-s = np.loadtxt(s_filepath)
+_, _, frames = read_analemmas(filepath)
+x = frames[:, 0]
+y = frames[:, 1]
+z = frames[:, 2]
+s = np.array(frames[:, 3])
 
 assert (x.shape == y.shape)
 assert (x.shape == z.shape)
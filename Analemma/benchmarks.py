@@ -0,0 +1,177 @@
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from kepler import solve_kepler
+from analemma_jit import HAS_NUMBA
+from draw_analemma import (
+    approx_analemma, iter_analemma_blocks, project_analemma, solve_analemma,
+    solve_projected_analemma,
+)
+from equation_time import solve_noon_shift
+
+EPS = np.deg2rad(23.44)
+GAM = np.deg2rad(12.93)
+
+
+def _measure(func, repeat):
+    # Best wall time over `repeat` runs, and peak traced memory of one run
+    with redirect_stdout(io.StringIO()):
+        func()  # warm-up
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return min(times), peak
+
+
+def _kepler_iterations(M, ecc):
+    _, it = solve_kepler(M, ecc)
+    return dict(max=int(np.amax(it)), mean=float(np.mean(it)))
+
+
+def _noon_iterations(ecc, N):
+    with redirect_stdout(io.StringIO()):
+        *_, info = solve_noon_shift(ecc, np.cos(EPS), GAM, N, full_output=True)
+    it = info["iterations"]
+    return dict(max=int(np.amax(it)), mean=float(np.mean(it)))
+
+
+def bench_cases(sizes, eccs, batches, n_export=400):
+    """ Yield (name, params, func, iterations) for every benchmark case.
+    """
+    for n in sizes:
+        M = np.linspace(0, 2 * np.pi, n, endpoint=False)
+        for ecc in eccs:
+            params = dict(n=n, ecc=ecc)
+            iterations = _kepler_iterations(M, ecc)
+            yield (
+                "solve_analemma", params,
+                lambda: solve_analemma(EPS, ecc, GAM, M), iterations,
+            )
+            yield (
+                "approx_analemma", params,
+                lambda: approx_analemma(EPS, ecc, GAM, M), None,
+            )
+        for backend in ["numpy", "numba"] if HAS_NUMBA else ["numpy"]:
+            yield (
+                "solve_projected", dict(n=n, backend=backend),
+                lambda: solve_projected_analemma(
+                    EPS, 0.0167, GAM, M, backend=backend
+                ), None,
+            )
+        x = solve_analemma(EPS, 0.0167, GAM, M)
+
+        def project():
+            project_analemma(*(np.copy(xi) for xi in x))
+        yield "project_analemma", dict(n=n), project, None
+
+    M = np.linspace(0, 2 * np.pi, n_export, endpoint=False)
+    for batch in batches:
+        for ecc in eccs:
+            shifts = np.linspace(0, 360, batch, endpoint=False)
+            params = dict(n=n_export, batch=batch, ecc=ecc)
+
+            def export():
+                for _ in iter_analemma_blocks(23.44, ecc, shifts, n_export, 64):
+                    pass
+            yield "iter_analemma_blocks", params, export, _kepler_iterations(M, ecc)
+
+            def export_f32():
+                blocks = iter_analemma_blocks(
+                    23.44, ecc, shifts, n_export, 64, dtype=np.float32
+                )
+                for _ in blocks:
+                    pass
+            params = dict(params, dtype="float32")
+            yield "iter_analemma_blocks", params, export_f32, None
+
+    for N in [365, 687]:
+        for ecc in [e for e in eccs if e <= 0.5]:
+            params = dict(N=N, ecc=ecc)
+            func = lambda: solve_noon_shift(ecc, np.cos(EPS), GAM, N)
+            yield "solve_noon_shift", params, func, _noon_iterations(ecc, N)
+
+
+def run(sizes, eccs, batches, repeat=3):
+    results = []
+    for name, params, func, iterations in bench_cases(sizes, eccs, batches):
+        wall, peak = _measure(func, repeat)
+        results.append(
+            dict(name=name, params=params, time=wall, peak_mem=peak,
+                 iterations=iterations)
+        )
+        print(
+            f"{name:>18s} {json.dumps(params):45s} "
+            f"{1e3 * wall:10.3f} ms {peak / 2**20:10.2f} MiB"
+        )
+    meta = dict(
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        date=time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    return dict(meta=meta, results=results)
+
+
+def compare(current, baseline, threshold=1.25):
+    """ List the cases slower or heavier than `threshold` times the baseline.
+    """
+    def key(r):
+        return r["name"], json.dumps(r["params"], sort_keys=True)
+
+    reference = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        ref = reference.get(key(r))
+        if ref is None:
+            continue
+        for field in ("time", "peak_mem"):
+            if ref[field] > 0 and r[field] > threshold * ref[field]:
+                ratio = r[field] / ref[field]
+                regressions.append((r["name"], r["params"], field, ratio))
+        it, ref_it = r["iterations"], ref["iterations"]
+        if it and ref_it and it["max"] > ref_it["max"]:
+            ratio = it["max"] / max(ref_it["max"], 1)
+            regressions.append((r["name"], r["params"], "iterations", ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analemma kernel benchmarks")
+    parser.add_argument("--output", default="bench_analemma.json")
+    parser.add_argument("--compare", default="", help="baseline json file")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--max-exp", type=int, default=7, help="up to 10^max-exp")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sizes = [10**k for k in range(2, args.max_exp + 1)]
+    eccs = [0.0, 0.0167, 0.1, 0.5, 0.75, 0.95]
+    batches = [1, 16, 180, 1024]
+    current = run(sizes, eccs, batches, args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for name, params, field, ratio in regressions:
+            print(f"REGRESSION {name} {json.dumps(params)}: {field} x{ratio:.2f}")
+        if regressions:
+            sys.exit(1)
+        print("No regression")
@@ -5,6 +5,11 @@ from matplotlib.collections import LineCollection
 from matplotlib.patches import Patch
 from numpy import pi, sin, cos
 
+from analemma_cache import AnalemmaCache
+from analemma_jit import HAS_NUMBA, solve_projected
+from analemma_io import FIELDS, write_header
+from kepler import solve_kepler
+
 # fmt: off
 Months = [f"Mo {i + 1:02d}" for i in range(12)]
 offset = 0.0  # year start to perihelion in [0, 1)
@@ -22,44 +27,352 @@ offset = 0.0  # year start to perihelion in [0, 1)
 # offset = 0.7259  # Mars spring equinox (year start) to perihelion
 # fmt: on
 
-
-def project_analemma(x1, x2, x3, mask=True):
-    norm = np.sqrt(x1 * x1 + x2 * x2 + x3 * x3)
-    x1[:] /= norm
-    x2[:] /= norm
-    x3[:] /= norm
+# Kepler equation is solved by chunks of samples, to bound its temporaries
+KEPLER_CHUNK = 2**16
+# Above this eccentricity, float32 solvers still solve Kepler in float64
+F32_KEPLER_MAX_ECC = 0.5
+
+# Curves already computed by the plotting functions
+curve_cache = AnalemmaCache(max_bytes=256 * 2**20, path=None)
+
+
+def _year_offset(value):
+    return offset if value is None else value
+
+
+def _buffer(work, name, shape, dtype=np.float64):
+    # Scratch array `name` of the `work` dict, reallocated only when its
+    # shape or dtype changes, so that repeated calls do not allocate
+    if work is None:
+        return np.empty(shape, dtype)
+    buf = work.get(name)
+    if buf is None or buf.shape != shape or buf.dtype != dtype:
+        buf = work[name] = np.empty(shape, dtype)
+    return buf
+
+
+def _out_views(out, shape):
+    # 4D views on the user outputs, which must not require a copy
+    views = []
+    for x in out:
+        view = x.view()
+        view.shape = shape
+        views.append(view)
+    return views
+
+
+def _combine(terms, out, tmp):
+    # out = sum of coef * basis over terms, a None basis being a constant,
+    # using `tmp` as the only temporary. Coefficients are cast to the output
+    # dtype, so that float32 outputs are computed in float32
+    terms = [(np.asarray(coef, dtype=out.dtype), basis) for coef, basis in terms]
+    (coef, basis), *others = [t for t in terms if t[1] is not None]
+    np.multiply(basis, coef, out=out)
+    for coef, basis in others:
+        np.multiply(basis, coef, out=tmp)
+        out += tmp
+    for coef, basis in terms:
+        if basis is None:
+            out += coef
+    return out
+
+
+def project_analemma(x1, x2, x3, mask=True, dx=None, work=None):
+    """ Normalize (x1, x2, x3) in place, and set to NaN the points below the
+    horizon (x1 <= 0) if mask. The derivatives dx, if given, are transformed
+    into the derivatives of the unit vector.
+    """
+    inv = _buffer(work, "inv_norm", np.shape(x1), x1.dtype)
+    sq = _buffer(work, "sq", np.shape(x1), x1.dtype)
+    np.multiply(x1, x1, out=inv)
+    for xi in (x2, x3):
+        np.multiply(xi, xi, out=sq)
+        inv += sq
+    np.sqrt(inv, out=inv)
+    np.reciprocal(inv, out=inv)
     if mask:
-        mask = x1 <= 0.0
-        x1[mask] = np.nan
-        x2[mask] = np.nan
-        x3[mask] = np.nan
+        np.copyto(inv, np.nan, where=x1 <= 0.0)
+    x1 *= inv
+    x2 *= inv
+    x3 *= inv
+    if dx is not None:
+        # Derivative of the unit vector: (dx - u (u . dx)) / |x|
+        dx1, dx2, dx3 = dx
+        dot = x1 * dx1 + x2 * dx2 + x3 * dx3
+        for dxi, xi in zip(dx, (x1, x2, x3)):
+            dxi -= xi * dot
+            dxi *= inv
     return
 
 
-def approx_analemma(eps, e, g, M_astro):
+def approx_analemma(
+    eps, e, g, M_astro, offset=None, derivative=False, out=None, work=None,
+    dtype=np.float64,
+):
     assert 0.0 <= e < 1.0
     assert 0. <= eps <= np.pi / 2.0
     assert 0 <= g <= 2 * np.pi
-    
-    M = M_astro - offset * 2 * np.pi  # M astro -> M civil
-    mu = M + g
 
-    ce, se = np.cos(eps), np.sin(eps)
+    M_astro = np.asarray(M_astro, dtype=float)
+    if out is not None:
+        approx_analemma_grid(
+            eps, e, g, M_astro.ravel(), offset=offset, derivative=derivative,
+            out=_out_views(out, (1, 1, 1, M_astro.size)), work=work,
+            dtype=out[0].dtype,
+        )
+        return tuple(out)
+    xs = approx_analemma_grid(
+        eps, e, g, M_astro.ravel(), offset=offset, derivative=derivative,
+        work=work, dtype=dtype,
+    )
+    return tuple(x[0, 0, 0].reshape(M_astro.shape) for x in xs)
+
+
+def approx_analemma_grid(
+    eps, e, g, M_astro, offset=None, derivative=False, out=None, work=None,
+    dtype=np.float64,
+):
+    """ First-order approximation of the analemma for a grid of parameters.
+    Args:
+        eps (np.ndarray): planet obliquities, shape (n_eps,)
+        e (np.ndarray): planet eccentricities, shape (n_ecc,)
+        g (np.ndarray): winter solstice to perihelion angles, shape (n_g,)
+        M_astro (np.ndarray): mean anomalies, in radians, shape (n_M,)
+        derivative (bool, optional): also return dx1, dx2, dx3 w.r.t. M
+        out (tuple, optional): 3 (or 6 with derivative) output arrays of
+            shape (n_eps, n_ecc, n_g, n_M)
+        work (dict, optional): scratch buffers, filled on the first call and
+            reused by the next ones
+        dtype (np.dtype, optional): float64, or float32 to halve memory and
+            bandwidth, the series being accurate to ~e^2 anyway
 
-    x1 = (1 + ce) / 2 - (1 - ce) / 2 * np.cos(2 * mu)
-    x2 = (1 - ce) / 2 * np.sin(2 * mu)
-    x3 = -se * np.cos(mu)
+    Returns:
+        x1, x2, x3 (np.ndarray): arrays of shape (n_eps, n_ecc, n_g, n_M).
+    """
+    eps = np.atleast_1d(np.asarray(eps, dtype=float))[:, None, None, None]
+    e = np.atleast_1d(np.asarray(e, dtype=float))[None, :, None, None]
+    g = np.atleast_1d(np.asarray(g, dtype=float))[None, None, :, None]
+    M_astro = np.atleast_1d(np.asarray(M_astro, dtype=float))
+    shape = np.broadcast_shapes(eps.shape, e.shape, g.shape, M_astro.shape)
+
+    # Harmonics of mu = M + g, from a single cos and sin through the
+    # angle-addition formulas
+    offset = _year_offset(offset)
+    c1, s1, c2, s2, c3, s3 = (
+        _buffer(work, f"approx_{name}", (1, 1, g.size, M_astro.size), dtype)
+        for name in ["c1", "s1", "c2", "s2", "c3", "s3"]
+    )
+    np.add(M_astro, g - offset * 2 * np.pi, out=c3)  # M astro -> M civil
+    np.cos(c3, out=c1)
+    np.sin(c3, out=s1)
+    np.multiply(c1, c1, out=c2)  # cos(2mu) = 2 cos^2(mu) - 1
+    c2 *= 2.0
+    c2 -= 1.0
+    np.multiply(s1, c1, out=s2)  # sin(2mu) = 2 sin(mu) cos(mu)
+    s2 *= 2.0
+    np.multiply(c2, 2.0, out=c3)  # cos(3mu) = cos(mu) (2 cos(2mu) - 1)
+    np.multiply(c3, s1, out=s3)  # sin(3mu) = sin(mu) (2 cos(2mu) + 1)
+    s3 += s1
+    c3 -= 1.0
+    c3 *= c1
+
+    # The series as linear combinations of the harmonics, expanding
+    # cos(mu - g), cos(mu + g), cos(3mu - g), ... with cg = cos(g), sg = sin(g)
+    ce, se = np.cos(eps), np.sin(eps)
+    cg, sg = np.cos(g), np.sin(g)
+    p, m = e * (1 + ce), e * (1 - ce)
+    series = [
+        [((1 + ce) / 2, None), ((3 * m / 4 - p / 2) * cg, "c1"),
+         (-(3 * m / 4 + p / 2) * sg, "s1"), (-(1 - ce) / 2, "c2"),
+         (-m / 4 * cg, "c3"), (-m / 4 * sg, "s3")],
+        [((p - 3 * m / 4) * cg, "s1"), (-(p + 3 * m / 4) * sg, "c1"),
+         ((1 - ce) / 2, "s2"), (m / 4 * cg, "s3"), (-m / 4 * sg, "c3")],
+        [(3 * e * se * cg / 2, None), (-se, "c1"), (-e * se * cg / 2, "c2"),
+         (-e * se * sg / 2, "s2")],
+    ]
+    if derivative:
+        # d cos(k mu) / dM = -k sin(k mu) and d sin(k mu) / dM = k cos(k mu)
+        swap = {"c": "s", "s": "c"}
+        sign = {"c": -1.0, "s": 1.0}
+        series += [
+            [(sign[b[0]] * int(b[1]) * coef, swap[b[0]] + b[1])
+             for coef, b in terms if b is not None]
+            for terms in series
+        ]
+
+    basis = dict(c1=c1, s1=s1, c2=c2, s2=s2, c3=c3, s3=s3)
+    if out is None:
+        out = [np.empty(shape, dtype) for _ in series]
+    tmp = _buffer(work, "tmp", shape, dtype)
+    for terms, x in zip(series, out):
+        terms = [(coef, basis.get(b)) for coef, b in terms]
+        _combine(terms, x, tmp)
+    return tuple(out)
+
+
+def solve_kepler_grid(
+    ecc, M_astro, tol=1e-12, max_iter=3, offset=None, work=None,
+    dtype=np.float64,
+):
+    """ Eccentric anomalies used by solve_analemma_grid, to be solved once
+    and passed to several calls sharing the eccentricities and anomalies.
+    Args:
+        ecc (np.ndarray): distinct and sorted eccentricities, shape (n_u,)
+        M_astro (np.ndarray): mean anomalies, in radians, shape (n_M,)
+        offset, work, dtype (optional): as in solve_analemma_grid
 
-    x1 -= e * (1 + ce) * np.cos(mu - g) / 2
-    x2 += e * (1 + ce) * np.sin(mu - g)
-    x1 += e * (1 - ce) * (3 * np.cos(mu + g) - np.cos(3 * mu - g)) / 4
-    x2 -= e * (1 - ce) * (3 * np.sin(mu + g) - np.sin(3 * mu - g)) / 4
-    x3 += e * se * (3 * np.cos(g) - np.cos(2 * mu - g)) / 2
+    Returns:
+        E (np.ndarray): eccentric anomalies, shape (n_u, n_M)
+    """
+    ecc = np.atleast_1d(np.asarray(ecc, dtype=float))
+    M = np.atleast_1d(np.asarray(M_astro, dtype=float))
+    offset = _year_offset(offset)
+    # In float32, Kepler's equation is ill-conditioned near perihelion for
+    # high eccentricities, the error on E being amplified by 1 / (1 - e)
+    k_dtype = dtype
+    if np.dtype(dtype) != np.float64 and ecc[-1] > F32_KEPLER_MAX_ECC:
+        k_dtype = np.float64
+    k_tol = max(tol, 16 * np.finfo(k_dtype).eps)
+    k_ecc = ecc[:, None].astype(k_dtype)
+    E = _buffer(work, "solve_E", (ecc.size, M.size), k_dtype)
+    for start in range(0, M.size, KEPLER_CHUNK):
+        chunk = slice(start, start + KEPLER_CHUNK)
+        M_chunk = (M[None, chunk] - offset * 2 * np.pi).astype(k_dtype)
+        E[:, chunk], _ = solve_kepler(M_chunk, k_ecc, k_tol, max_iter)
+    return E
+
+
+def solve_analemma_grid(
+    tilt, ecc, g, M_astro, tol=1e-12, max_iter=3, offset=None,
+    derivative=False, out=None, work=None, dtype=np.float64, E=None,
+):
+    """ Solve the analemma for a whole grid of parameters at once.
+    Args:
+        tilt (np.ndarray): planet obliquities, shape (n_eps,)
+        ecc (np.ndarray): planet eccentricities, shape (n_ecc,)
+        g (np.ndarray): winter solstice to perihelion angles, shape (n_g,)
+        M_astro (np.ndarray): mean anomalies, in radians, shape (n_M,)
+        offset (float, optional): Winter solstice to year start in [0, 1),
+            defaults to the module-level `offset`
+        derivative (bool, optional): also return dx1, dx2, dx3 w.r.t. M
+        out (tuple, optional): 3 (or 6 with derivative) output arrays of
+            shape (n_eps, n_ecc, n_g, n_M)
+        work (dict, optional): scratch buffers, filled on the first call and
+            reused by the next ones
+        dtype (np.dtype, optional): float64, or float32 for storage and
+            arithmetic, Kepler's equation being still solved in float64 for
+            eccentricities above F32_KEPLER_MAX_ECC
+        E (np.ndarray, optional): eccentric anomalies from solve_kepler_grid
+            for np.unique(ecc), M_astro and offset, solved here if None
 
-    return x1, x2, x3
+    Returns:
+        x1, x2, x3 (np.ndarray): Planet-Sun vectors in planet-centric coords,
+            each of shape (n_eps, n_ecc, n_g, n_M).
+    """
+    tilt = np.atleast_1d(np.asarray(tilt, dtype=float))
+    ecc = np.atleast_1d(np.asarray(ecc, dtype=float))
+    g = np.atleast_1d(np.asarray(g, dtype=float))
+    offset = _year_offset(offset)
+    M = np.atleast_1d(np.asarray(M_astro, dtype=float))
+    shape = (tilt.size, ecc.size, g.size, M.size)
+
+    # Kepler equation only depends on (ecc, M): solve it once per distinct
+    # eccentricity
+    ecc_unique, ecc_inverse = np.unique(ecc, return_inverse=True)
+    n_u = ecc_unique.size
+    cM, sM = (
+        _buffer(work, f"solve_{name}", (M.size,), dtype) for name in ["cM", "sM"]
+    )
+    np.subtract(M, offset * 2 * np.pi, out=sM)  # M astro -> M civil
+
+    if E is None:
+        E = solve_kepler_grid(ecc_unique, M, tol, max_iter, offset, work, dtype)
+    np.cos(sM, out=cM)
+    np.sin(sM, out=sM)
+
+    # With P = r cos(nu) and Q = r sin(nu), the Sun direction is
+    #   u1 = (1 + ce) / 2 cos(nu - M) - (1 - ce) / 2 cos(nu + M + 2g)
+    #   u2 = (1 + ce) / 2 sin(nu - M) + (1 - ce) / 2 sin(nu + M + 2g)
+    #   u3 = -se cos(nu + g)
+    # so that x = r u only needs the products of P, Q with cos M, sin M
+    names = ["P", "Q", "rcD", "rsD", "rcS", "rsS"]
+    P, Q, rcD, rsD, rcS, rsS = (
+        _buffer(work, f"solve_{name}", (n_u, M.size), dtype) for name in names
+    )
+    e = ecc_unique[:, None].astype(dtype)
+    b = np.sqrt(1 - e * e)
+    np.cos(E, out=P)
+    np.sin(E, out=Q)
+    if derivative:
+        dP, dQ, dcD, dsD, dcS, dsS = (
+            _buffer(work, f"solve_d{name}", (n_u, M.size), dtype) for name in names
+        )
+        # dE/dM = 1 / r: dP/dM = -sin(E) / r and dQ/dM = b cos(E) / r
+        np.multiply(P, -e, out=dcD)
+        dcD += 1.0
+        np.divide(Q, dcD, out=dP)
+        np.negative(dP, out=dP)
+        np.divide(P, dcD, out=dQ)
+        dQ *= b
+    P -= e
+    Q *= b
+
+    tmp = _buffer(work, "solve_tmp", (n_u, M.size), dtype)
+
+    def rotate(P, Q, cD, sD, cS, sS):
+        # (cD, sD) = (P, Q) rotated by -M and (cS, sS) rotated by +M
+        np.multiply(P, cM, out=cD)
+        np.multiply(Q, sM, out=tmp)
+        np.subtract(cD, tmp, out=cS)
+        cD += tmp
+        np.multiply(Q, cM, out=sD)
+        np.multiply(P, sM, out=tmp)
+        np.add(sD, tmp, out=sS)
+        sD -= tmp
+        return
+
+    rotate(P, Q, rcD, rsD, rcS, rsS)
+    if derivative:
+        # d(rcD)/dM = dcD + rsD, d(rsD)/dM = dsD - rcD, etc.
+        rotate(dP, dQ, dcD, dsD, dcS, dsS)
+        dcD += rsD
+        dsD -= rcD
+        dcS -= rsS
+        dsS += rcS
+
+    bases = [(P, Q, rcD, rsD, rcS, rsS)]
+    if derivative:
+        bases.append((dP, dQ, dcD, dsD, dcS, dsS))
+    if not np.array_equal(ecc_unique, ecc):
+        bases = [[x[ecc_inverse] for x in basis] for basis in bases]
+
+    ce = np.cos(tilt)[:, None, None, None]
+    se = np.sin(tilt)[:, None, None, None]
+    cg = np.cos(g)[None, None, :, None]
+    sg = np.sin(g)[None, None, :, None]
+    c2g, s2g = cg * cg - sg * sg, 2 * sg * cg
+    if out is None:
+        out = [np.empty(shape, dtype) for _ in range(3 * len(bases))]
+    tmp = _buffer(work, "tmp", shape, dtype)
+    for k, (P, Q, cD, sD, cS, sS) in enumerate(bases):
+        P, Q, cD, sD, cS, sS = (x[None, :, None, :] for x in (P, Q, cD, sD, cS, sS))
+        x1, x2, x3 = out[3 * k: 3 * k + 3]
+        _combine(
+            [((1 + ce) / 2, cD), (-(1 - ce) / 2 * c2g, cS), ((1 - ce) / 2 * s2g, sS)],
+            x1, tmp,
+        )
+        _combine(
+            [((1 + ce) / 2, sD), ((1 - ce) / 2 * c2g, sS), ((1 - ce) / 2 * s2g, cS)],
+            x2, tmp,
+        )
+        _combine([(-se * cg, P), (se * sg, Q)], x3, tmp)
+    return tuple(out)
 
 
-def solve_analemma(tilt, ecc, g, M_astro, tol=1e-9, max_iter=20):
+def solve_analemma(
+    tilt, ecc, g, M_astro, tol=1e-12, max_iter=3, offset=None, derivative=False,
+    out=None, work=None, dtype=np.float64, E=None,
+):
     """ Solve the analemma for given parameters.
     Args:
         tilt (float): planet obliquity
@@ -67,108 +380,248 @@ def solve_analemma(tilt, ecc, g, M_astro, tol=1e-9, max_iter=20):
         g (float): winter solstice to perihelion angle
         M (np.ndarray): mean anomaly, in radians
         offset (float, optional): Winter solstice to year start in [0, 1)
+        derivative (bool, optional): also return dx1, dx2, dx3 w.r.t. M
+        out (tuple, optional): 3 (or 6) contiguous output arrays, shaped as M
+        work (dict, optional): scratch buffers reused between calls
+        dtype (np.dtype, optional): float64 or float32, see solve_analemma_grid
+        E (np.ndarray, optional): eccentric anomalies, see solve_analemma_grid
 
     Returns:
         x1, x2, x3 (np.ndarray): Planet-Sun vector in planet-centric coords.
     """
-    M = M_astro - offset * 2 * np.pi  # M astro -> M civil
-    E = np.copy(M) + ecc * np.sin(M)
-    
-    it, delta = 0, 1.0
-    while it < max_iter and tol < np.amax(np.abs(delta)):
-        f = E - ecc * np.sin(E) - M
-        df = 1 - ecc * np.cos(E)
-        delta = -f / df
-        E += delta
-        it += 1
-    if it == max_iter:
-        print("Warning: did not converge in solve_analemma")
-        
-    r = 1 - ecc * np.cos(E)
-    cos_nu = (np.cos(E) - ecc) / r
-    sin_nu = np.sqrt(1 - ecc * ecc) * np.sin(E) / r
-        
-    cos_gm, sin_gm = np.cos(g), np.sin(g)
-    cos_ep, sin_ep = np.cos(tilt), np.sin(tilt)
-    cos_nu_g = cos_nu * cos_gm - sin_nu * sin_gm
-    sin_nu_g = sin_nu * cos_gm + cos_nu * sin_gm
-    cos_th = -np.cos(M + g)
-    sin_th = -np.sin(M + g)
-    
-    x1 = r * (-cos_ep * cos_nu_g * cos_th - sin_nu_g * sin_th)
-    x2 = r * (+cos_ep * cos_nu_g * sin_th - sin_nu_g * cos_th)
-    x3 = r * (-sin_ep * cos_nu_g)
-    return x1, x2, x3
+    M_astro = np.asarray(M_astro, dtype=float)
+    if out is not None:
+        solve_analemma_grid(
+            tilt, ecc, g, M_astro.ravel(), tol=tol, max_iter=max_iter,
+            offset=offset, derivative=derivative,
+            out=_out_views(out, (1, 1, 1, M_astro.size)), work=work,
+            dtype=out[0].dtype, E=E,
+        )
+        return tuple(out)
+    xs = solve_analemma_grid(
+        tilt, ecc, g, M_astro.ravel(), tol=tol, max_iter=max_iter,
+        offset=offset, derivative=derivative, work=work, dtype=dtype, E=E,
+    )
+    return tuple(x[0, 0, 0].reshape(M_astro.shape) for x in xs)
+
+
+def solve_projected_analemma(
+    tilt, ecc, g, M_astro, tol=1e-12, max_iter=3, offset=None, mask=True,
+    backend="auto", out=None, work=None, E=None,
+):
+    """ Unit Planet-Sun vector, i.e. solve_analemma then project_analemma.
+    Args:
+        tilt, ecc, g (float): obliquity, eccentricity and phase, in radians
+        M_astro (np.ndarray): mean anomaly, in radians
+        mask (bool, optional): NaN below the horizon, as project_analemma
+        backend (str, optional): "numba" fuses Kepler, rotation and projection
+            in one parallel loop, "numpy" chains the vectorized kernels, and
+            "auto" uses numba when it is installed
+        out, work (optional): as in solve_analemma
+        E (np.ndarray, optional): eccentric anomalies from solve_kepler_grid,
+            used by the numpy backend only (numba solves Kepler in its loop)
+
+    Returns:
+        x1, x2, x3 (np.ndarray): unit vectors, shaped as M_astro.
+    """
+    if backend == "auto":
+        backend = "numba" if HAS_NUMBA else "numpy"
+    if backend == "numpy":
+        xs = solve_analemma(
+            tilt, ecc, g, M_astro, tol, max_iter, offset, out=out, work=work,
+            E=E,
+        )
+        project_analemma(*xs, mask=mask, work=work)
+        return xs
+    if backend != "numba":
+        raise ValueError(f"unknown backend {backend}")
+    if not HAS_NUMBA:
+        raise ImportError("the numba backend requires numba")
+
+    M_astro = np.asarray(M_astro, dtype=float)
+    M = np.ascontiguousarray(M_astro.ravel()) - _year_offset(offset) * 2 * np.pi
+    if out is None:
+        out = tuple(np.empty(M_astro.shape) for _ in range(3))
+    x1, x2, x3 = _out_views(out, (M.size,))
+    n_fail = solve_projected(
+        M, float(ecc), np.cos(tilt), np.sin(tilt), np.cos(g), np.sin(g),
+        tol, max_iter, mask, x1, x2, x3,
+    )
+    if n_fail > 0:
+        print("Warning: did not converge in solve_kepler")
+    return tuple(out)
+
+
+def _analemma_frames(
+    eps_rad, ecc, gam_rad, M, tol, max_iter, dtype=np.float64, E=None
+):
+    # Exact and approximated analemmas for a block of shifts, with the
+    # layout of analemma_io.FIELDS: shape (n_shifts, 8, n)
+    frames = np.empty((gam_rad.size, len(FIELDS), M.size), dtype)
+    exact = solve_analemma_grid(
+        eps_rad, ecc, gam_rad, M, tol, max_iter, offset=0.0, derivative=True,
+        dtype=dtype, E=E,
+    )
+    approx = approx_analemma_grid(
+        eps_rad, ecc, gam_rad, M, offset=0.0, derivative=True, dtype=dtype
+    )
+    for k, xs in [(0, exact), (4, approx)]:
+        x1, x2, x3, dx1, dx2, dx3 = (x[0, 0] for x in xs)
+        frames[:, k + 0], frames[:, k + 1], frames[:, k + 2] = x1, x2, x3
+        frames[:, k + 3] = np.sqrt(dx1 * dx1 + dx2 * dx2 + dx3 * dx3)
+    return frames
 
 
-def export_analemmas(eps, ecc, shifts, path, n=400, tol=1e-9, max_iter=20):
+def iter_analemma_blocks(
+    eps, ecc, shifts, n=400, block=64, tol=1e-12, max_iter=3, dtype=np.float64
+):
+    """ Compute the exported analemmas by blocks of shifts.
+    Args:
+        eps (float): obliquity, in degrees
+        ecc (float): eccentricity
+        shifts (np.ndarray): phase shifts, in degrees
+        n (int, optional): number of samples per analemma
+        block (int, optional): number of shifts per block
+        dtype (np.dtype, optional): precision of the computation and frames
+
+    Yields:
+        shifts (np.ndarray): phase shifts of the block, shape (n_block,)
+        frames (np.ndarray): frames of shape (n_block, len(FIELDS), n)
+    """
+    shifts = np.atleast_1d(np.asarray(shifts, dtype=float))
     eps_rad = np.deg2rad(eps)
-    gam_rad = np.deg2rad(shifts)
-    M, dM = np.linspace(0, 2 * np.pi, n, endpoint=False, retstep=True)
-
-    E = np.copy(M) + ecc * np.sin(M)
-    it, delta = 0, 1.0
-    while it < max_iter and tol < np.amax(np.abs(delta)):
-        f = E - ecc * np.sin(E) - M
-        df = 1 - ecc * np.cos(E)
-        delta = -f / df
-        E += delta
-        it += 1
-    if it == max_iter:
-        print("Warning: did not converge in export_analemmas")
-        
-    r = 1 - ecc * np.cos(E)
-    cos_nu = (np.cos(E) - ecc) / r
-    sin_nu = np.sqrt(1 - ecc * ecc) * np.sin(E) / r
-        
-    cos_gm, sin_gm = np.cos(gam_rad), np.sin(gam_rad)
-    cos_ep, sin_ep = np.cos(eps_rad), np.sin(eps_rad)
-    cos_nu_g = np.outer(cos_gm, cos_nu) - np.outer(sin_gm, sin_nu)
-    sin_nu_g = np.outer(cos_gm, sin_nu) + np.outer(sin_gm, cos_nu)
-    cos_th = -np.cos(M[None, :] + gam_rad[:, None])
-    sin_th = -np.sin(M[None, :] + gam_rad[:, None])
-    
-    # Exact solution
-    x1 = r * (-cos_ep * cos_nu_g * cos_th - sin_nu_g * sin_th)
-    x2 = r * (+cos_ep * cos_nu_g * sin_th - sin_nu_g * cos_th)
-    x3 = r * (-sin_ep * cos_nu_g)
-    dx1 = (np.roll(x1, 1, axis=1) - np.roll(x1, -1, axis=1)) / (2 * dM)
-    dx2 = (np.roll(x2, 1, axis=1) - np.roll(x2, -1, axis=1)) / (2 * dM)
-    dx3 = (np.roll(x3, 1, axis=1) - np.roll(x3, -1, axis=1)) / (2 * dM)
-    ds = np.sqrt(dx1 * dx1 + dx2 * dx2 + dx3 * dx3)
-
-    # Analytic solution
-    mu = M[None, :] + gam_rad[:, None]
-    _1mu_m_g = 1 * mu - gam_rad[:, None]
-    _1mu_p_g = 1 * mu + gam_rad[:, None]
-    _2mu_m_g = 2 * mu - gam_rad[:, None]
-    _3mu_m_g = 3 * mu - gam_rad[:, None]
-    x1_ = (1 + cos_ep) / 2 - (1 - cos_ep) / 2 * np.cos(2 * mu)
-    x2_ = (1 - cos_ep) / 2 * np.sin(2 * mu)
-    x3_ = -sin_ep * np.cos(mu)
-    x1_ -= ecc * (1 + cos_ep) * np.cos(_1mu_m_g) / 2
-    x2_ += ecc * (1 + cos_ep) * np.sin(_1mu_m_g)
-    x1_ += ecc * (1 - cos_ep) * (3 * np.cos(_1mu_p_g) - np.cos(_3mu_m_g)) / 4
-    x2_ -= ecc * (1 - cos_ep) * (3 * np.sin(_1mu_p_g) - np.sin(_3mu_m_g)) / 4
-    x3_ += ecc * sin_ep * (3 * np.cos(gam_rad[:, None]) - np.cos(_2mu_m_g)) / 2
-    dx1_ = (np.roll(x1_, 1, axis=1) - np.roll(x1_, -1, axis=1)) / (2 * dM)
-    dx2_ = (np.roll(x2_, 1, axis=1) - np.roll(x2_, -1, axis=1)) / (2 * dM)
-    dx3_ = (np.roll(x3_, 1, axis=1) - np.roll(x3_, -1, axis=1)) / (2 * dM)
-    ds_ = np.sqrt(dx1_ * dx1_ + dx2_ * dx2_ + dx3_ * dx3_)
-    
+    M = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    # Kepler's equation does not depend on the shift: solve it once
+    E = solve_kepler_grid(ecc, M, tol, max_iter, offset=0.0, dtype=dtype)
+
+    for start in range(0, shifts.size, block):
+        shifts_block = shifts[start:start + block]
+        gam_rad = np.deg2rad(shifts_block)
+        frames = _analemma_frames(
+            eps_rad, ecc, gam_rad, M, tol, max_iter, dtype, E=E
+        )
+        yield shifts_block, frames
+
+
+def precision_error(
+    eps, ecc, shifts, n=400, tol=1e-12, max_iter=3, dtype=np.float32,
+    n_probes=8,
+):
+    """ Largest error of the frames computed in `dtype` w.r.t. float64,
+    for each field of analemma_io.FIELDS, over n_probes of the shifts.
+    """
+    shifts = np.atleast_1d(np.asarray(shifts, dtype=float))
+    probes = shifts[np.linspace(0, shifts.size - 1, n_probes).astype(int)]
+    eps_rad, gam_rad = np.deg2rad(eps), np.deg2rad(probes)
+    M = np.linspace(0, 2 * np.pi, n, endpoint=False)
+    exact = _analemma_frames(eps_rad, ecc, gam_rad, M, tol, max_iter)
+    approx = _analemma_frames(eps_rad, ecc, gam_rad, M, tol, max_iter, dtype)
+    error = np.amax(np.abs(approx - exact), axis=(0, 2))
+    return dict(zip(FIELDS, error.tolist()))
+
+
+def iter_analemmas(eps, ecc, shifts, n=400, block=64, tol=1e-12, max_iter=3):
+    """ Yield (shift, frame) pairs, frames of shape (len(FIELDS), n).
+    Shifts are computed by blocks, so that memory is bounded by `block`.
+    """
+    blocks = iter_analemma_blocks(eps, ecc, shifts, n, block, tol, max_iter)
+    for shifts_block, frames in blocks:
+        yield from zip(shifts_block, frames)
+
+
+def export_analemmas(
+    eps, ecc, shifts, path, n=400, tol=1e-12, max_iter=3, fmt="txt",
+    block=None, dtype=np.float64, store=np.float32,
+):
+    """ Export analemmas for several shifts, as one text file per field of
+    analemma_io.FIELDS (fmt="txt") or one binary analemma file (fmt="bin"),
+    whose frames are stored as `store`, float32 or float64.
+    """
+    block = len(shifts) if block is None else block
+    blocks = iter_analemma_blocks(
+        eps, ecc, shifts, n, block, tol, max_iter, dtype
+    )
+    if np.dtype(dtype) != np.float64:
+        error = precision_error(eps, ecc, shifts, n, tol, max_iter, dtype)
+        print(f"{np.dtype(dtype)} error w.r.t. float64: " + ", ".join(
+            f"{field} {err:.1e}" for field, err in error.items()
+        ))
+
     path = f"{path}eps_{eps:02.0f}_ecc_{100*ecc:02.0f}"
-    np.savetxt(f"{path}_x_exact.txt", x1, fmt="%.6e")
-    np.savetxt(f"{path}_y_exact.txt", x2, fmt="%.6e")
-    np.savetxt(f"{path}_z_exact.txt", x3, fmt="%.6e")
-    np.savetxt(f"{path}_s_exact.txt", ds, fmt="%.6e")
-    np.savetxt(f"{path}_x_approx.txt", x1_, fmt="%.6e")
-    np.savetxt(f"{path}_y_approx.txt", x2_, fmt="%.6e")
-    np.savetxt(f"{path}_z_approx.txt", x3_, fmt="%.6e")
-    np.savetxt(f"{path}_s_approx.txt", ds_, fmt="%.6e")
+    if fmt == "bin":
+        with open(f"{path}.bin", "wb") as f:
+            write_header(f, eps, ecc, shifts, n, store)
+            for _, frames in blocks:
+                frames.astype(np.dtype(store).newbyteorder("<")).tofile(f)
+        print(f"Exported analemma to {path}.bin")
+        return
+
+    files = [open(f"{path}_{field}.txt", "w") for field in FIELDS]
+    try:
+        for _, frames in blocks:
+            for k, f in enumerate(files):
+                np.savetxt(f, frames[:, k], fmt="%.6e")
+    finally:
+        for f in files:
+            f.close()
     print(f"Exported analemma to {path}_{{x,y,z,s}}.txt")
     return
 
 
+def adaptive_anomaly(
+    solver, eps, e, g, tol=1e-3, n_colors=12, n_init=8, max_iter=12,
+    offset=None,
+):
+    """ Sample the mean anomaly finely where the projected analemma bends.
+    Args:
+        solver (callable): solve_analemma or approx_analemma
+        eps, e, g (float): obliquity, eccentricity and phase, in radians
+        tol (float, optional): screen-space tolerance, in units of the
+            horizon radius, on the distance between the curve and its chords
+        n_colors (int, optional): number of colors (months) of the curve,
+            whose boundaries are always part of the samples
+        n_init (int, optional): initial number of intervals per month
+        max_iter (int, optional): maximum number of bisection passes
+
+    Returns:
+        t (np.ndarray): increasing mean anomalies from 0 to 2pi
+    """
+    def screen(t):
+        x1, x2, x3 = solver(eps, e, g, t, offset=offset)
+        project_analemma(x1, x2, x3)
+        return np.stack([-x2, x3], axis=-1)
+
+    t = np.linspace(0, 2 * np.pi, n_colors * n_init + 1)
+    p = screen(t)
+    for _ in range(max_iter):
+        t_mid = 0.5 * (t[:-1] + t[1:])
+        p_mid = screen(t_mid)
+        dev = np.hypot(*(p_mid - 0.5 * (p[:-1] + p[1:])).T)
+        # Also refine where the curve goes below the horizon
+        hidden, hidden_mid = np.isnan(p[:, 0]), np.isnan(p_mid[:, 0])
+        refine = (tol < dev)
+        refine |= (hidden_mid != hidden[:-1]) | (hidden_mid != hidden[1:])
+        if not np.any(refine):
+            break
+        idx = np.flatnonzero(refine)
+        t = np.insert(t, idx + 1, t_mid[idx])
+        p = np.insert(p, idx + 1, p_mid[idx], axis=0)
+    return t
+
+
+def _adaptive_samples(*args, **kwargs):
+    # adaptive_anomaly as a solver of curve_cache, which expects a tuple
+    return (adaptive_anomaly(*args, **kwargs),)
+
+
+def segment_colors(t, colors):
+    # Color of each segment [t_i, t_i+1], one color per month
+    n_colors = len(colors)
+    t_mid = 0.5 * (t[:-1] + t[1:])
+    idx = np.floor(t_mid / (2 * np.pi) * n_colors).astype(int)
+    return colors[np.clip(idx, 0, n_colors - 1)]
+
+
 def find_solstice_angle(e, nu):
     coef =  1.0 + e * np.cos(nu)
     cos_E = (e + np.cos(nu)) / coef
@@ -228,12 +681,11 @@ def plot_analemma(parameters, display_label=True, savefig=""):
     # Plot the analemma
     n = 150
     n_colors = 12
-    t = np.linspace(0, 2.0 * np.pi, n_colors * n + 1)
+    t_circle = np.linspace(0, 2.0 * np.pi, n_colors * n + 1)
     # t_labels = np.array([1, 1, 1, 1, 1, 1]) * (n * n_colors // 2)
     # t_labels[-1] = 550
 
     colors = plt.get_cmap("turbo")(np.linspace(0.0, 1.0, n_colors))
-    line_colors = np.repeat(colors, n, axis=0)
 
     for i, (eps, ecc, shift) in enumerate(parameters):
         assert 0.0 <= eps <= 90
@@ -241,13 +693,20 @@ def plot_analemma(parameters, display_label=True, savefig=""):
         assert 0.0 <= shift <= 360
         eps = np.deg2rad(eps)
         shift = np.deg2rad(shift)
-        # x1, x2, x3 = approx_analemma(eps, ecc, shift, t)
-        x1, x2, x3 = solve_analemma(eps, ecc, shift, t)
+        t, = curve_cache.get(
+            _adaptive_samples, solve_analemma, eps, ecc, shift, offset=offset
+        )
+        line_colors = segment_colors(t, colors)
+        # x1, x2, x3 = curve_cache.get(approx_analemma, eps, ecc, shift, t)
+        x1, x2, x3 = curve_cache.get(
+            solve_analemma, eps, ecc, shift, t, offset=offset
+        )
         project_analemma(x1, x2, x3)
         x, y, z = -x2, x3, x1
         label = r"$\epsilon={:.0f}^\circ$".format(np.rad2deg(eps))
         sign = 1
-        t_label = np.argmax(sign * y) if i < 5 else 500
+        t_label = np.searchsorted(t, 2 * np.pi * 500 / (n_colors * n))
+        t_label = np.argmax(sign * y) if i < 5 else t_label
         ha = "center" if i < 5 else "left"
         va = "bottom" if sign > 0 else "top"
         xl, yl = x[t_label], y[t_label]
@@ -260,11 +719,13 @@ def plot_analemma(parameters, display_label=True, savefig=""):
 
         points = np.array([x, y]).T.reshape(-1, 1, 2)
         segments = np.concatenate([points[:-1], points[1:]], axis=1)
-        lc = LineCollection(segments, colors=line_colors)
+        lc = LineCollection(segments, colors=line_colors, capstyle="round")
         lc.set_linewidth(2)
         ax.add_collection(lc)
 
-    ax.plot(np.cos(t), np.sin(t), color="k", lw=0.5, ls="-", alpha=0.5)
+    ax.plot(
+        np.cos(t_circle), np.sin(t_circle), color="k", lw=0.5, ls="-", alpha=0.5
+    )
     ax.set_aspect("equal")
     add_legend(ax, colors, (1.20, +0.5))
     add_directions(ax)
@@ -286,11 +747,8 @@ def compare(tilt, ecc, shift, savefig=""):
     figsize = (n_cols * size_x, size * (1 + pad_top))
     fig, ax = plt.subplots(1, 1, figsize=figsize)
 
-    n = 200
     m = 12
-    t = np.linspace(0, 2 * np.pi, m * n + 1)
     colors = plt.get_cmap("turbo")(np.linspace(0.0, 1.0, m))
-    line_colors = np.repeat(colors, n, axis=0)
     
     params = [
         (np.deg2rad(tilt), 0.0, 0.0, ":", 0.5),
@@ -301,25 +759,30 @@ def compare(tilt, ecc, shift, savefig=""):
     for col, (eps, e, g, ls, lw) in enumerate(params):
         cx = col * size_x
         cy = 0.0
+        t, = curve_cache.get(
+            _adaptive_samples, solve_analemma, eps, e, g, offset=offset
+        )
+        line_colors = segment_colors(t, colors)
         # Plot the approximation
-        x1, x2, x3 = approx_analemma(eps, e, g, t)
+        x1, x2, x3 = curve_cache.get(approx_analemma, eps, e, g, t, offset=offset)
         project_analemma(x1, x2, x3)
         x = cx + radius * (-x2)
         y = cy + radius * (+x3)
         # ax.plot(x, y, color="black", lw=0.5, alpha=1.0)
         
         # Plot the analemma
-        x1, x2, x3 = solve_analemma(eps, e, g, t)
-        project_analemma(x1, x2, x3)
+        x1, x2, x3, dx1, dx2, dx3 = curve_cache.get(
+            solve_analemma, eps, e, g, t, offset=offset, derivative=True
+        )
+        project_analemma(x1, x2, x3, dx=(dx1, dx2, dx3))
         x = cx + radius * (-x2)
         y = cy + radius * (+x3)
-        dx2 = np.gradient(x2, 2 * np.pi / (m * n))
-        dx3 = np.gradient(x3, 2 * np.pi / (m * n))
         ref_speed = 0.5
         speed = np.sqrt(dx2 * dx2 + dx3 * dx3) / ref_speed
         points = np.array([x, y]).T.reshape(-1, 1, 2)
         segments = np.concatenate([points[:-1], points[1:]], axis=1)
-        lc = LineCollection(segments, colors=line_colors)
+        speed = 0.5 * (speed[:-1] + speed[1:])
+        lc = LineCollection(segments, colors=line_colors, capstyle="round")
         lc.set_linewidth(2.0 / speed ** 0.75)
         # lc.set_linewidth(2.5 / speed ** 0.60)
         ax.add_collection(lc)
@@ -377,7 +840,18 @@ def mosaic(tilt, ecc_list, shift_list, savefig=""):
     shift_list = np.array(shift_list) * 2 * np.pi
 
     colors = plt.get_cmap("turbo")(np.linspace(0.0, 1.0, m))
-    line_colors = np.repeat(colors, n, axis=0)    
+    line_colors = np.repeat(colors, n, axis=0)
+    
+    # Solve every cell of the mosaic at once
+    X1, X2, X3 = curve_cache.get(
+        solve_analemma_grid, eps, ecc_list, shift_list, t, offset=offset
+    )
+    project_analemma(X1, X2, X3)
+
+    A1, A2, A3 = curve_cache.get(
+        approx_analemma_grid, eps, ecc_list, shift_list, t, offset=offset
+    )
+    project_analemma(A1, A2, A3)
 
     # for row, g in enumerate(shift_list):
     #     cx = -size - 0.5
@@ -385,48 +859,60 @@ def mosaic(tilt, ecc_list, shift_list, savefig=""):
     #     text = r"$\gamma={:.2f}\cdot2\pi$".format(g / (2 * np.pi))
     #     ax.text(cx, cy, text, fontsize=12, ha="left", va="center")
 
-    for col, e in enumerate(ecc_list):
-        cx = col * size
-        cy_top = size * (1 + pad_top)
-        b = np.sqrt(1 - e * e)
-        x_sun = cx + radius * e
-        ax.plot(x_sun, cy_top, "ok", ms=4, markerfacecolor='none')
-        x = cx + radius * np.cos(t)
-        y = cy_top + radius * np.sin(t) * b
-        ax.plot(x, y, color="k", lw=0.5, ls="-")
-        for row, g in enumerate(shift_list):
-            cy = -row * size
-            # Plot the approximation
-            x1, x2, x3 = approx_analemma(eps, e, g, t)
-            project_analemma(x1, x2, x3)
-            x = cx + radius * (-x2)
-            y = cy + radius * (+x3)
-            ax.plot(x, y, color="grey", lw=0.75)
-            
-            # Plot the analemma
-            x1, x2, x3 = solve_analemma(eps, e, g, t)
-            project_analemma(x1, x2, x3)
-            x = cx + radius * (-x2)
-            y = cy + radius * (+x3)
-            points = np.array([x, y]).T.reshape(-1, 1, 2)
-            segments = np.concatenate([points[:-1], points[1:]], axis=1)
-            lc = LineCollection(segments, colors=line_colors)
-            lc.set_linewidth(1.25)
-            ax.add_collection(lc)
-
-            # Plot the horizon of the observer
-            x = cx + radius * np.cos(t)
-            y = cy + radius * np.sin(t)
-            ax.plot(x, y, color="lightgrey", lw=0.5, ls="-", alpha=1)
-            # Plot the solstice position on ellipse
-            cos_Eg, sin_Eg = find_solstice_angle(e, g)
-            x = +radius * cos_Eg
-            y = -radius * sin_Eg * b
-            ax.plot(cx + x, cy_top + y, "-o", lw=0.5, color="k", ms=2.0)
-            # dd = 0.4
-            # xx = x + np.array([-pad, pad]) * x * dd
-            # yy = y + np.array([-pad, pad]) * y / b * dd
-            # ax.plot(cx + xx, cy_top + yy, ls="-", lw=0.5, color="k")
+    # Cell centers, shape (n_cols, n_rows, 1)
+    cx = (np.arange(n_cols) * size)[:, None, None]
+    cy = (-np.arange(n_rows) * size)[None, :, None]
+    cy_top = size * (1 + pad_top)
+    b = np.sqrt(1 - ecc_list * ecc_list)
+
+    # Plot the approximations
+    x = cx + radius * (-A2[0])
+    y = cy + radius * (+A3[0])
+    lines = np.stack([x, y], axis=-1).reshape(-1, t.size, 2)
+    ax.add_collection(LineCollection(lines, colors="grey", linewidths=0.75))
+
+    # Plot the analemmas
+    x = cx + radius * (-X2[0])
+    y = cy + radius * (+X3[0])
+    points = np.stack([x, y], axis=-1)
+    segments = np.stack([points[..., :-1, :], points[..., 1:, :]], axis=-2)
+    segments = segments.reshape(-1, 2, 2)
+    cell_colors = np.tile(line_colors, (n_cols * n_rows, 1))
+    lc = LineCollection(segments, colors=cell_colors)
+    lc.set_linewidth(np.full(segments.shape[0], 1.25))
+    ax.add_collection(lc)
+
+    # Plot the orbits and the horizons of the observer
+    x = cx[:, 0] + radius * np.cos(t)
+    y = cy_top + radius * np.sin(t) * b[:, None]
+    orbits = np.stack([x, y], axis=-1)
+    x, y = np.broadcast_arrays(cx + radius * np.cos(t), cy + radius * np.sin(t))
+    horizons = np.stack([x, y], axis=-1).reshape(-1, t.size, 2)
+    lc = LineCollection(
+        np.concatenate([orbits, horizons]),
+        colors=["k"] * n_cols + ["lightgrey"] * (n_cols * n_rows),
+        linewidths=0.5,
+    )
+    ax.add_collection(lc)
+
+    # Plot the Sun and the solstice positions on the ellipses
+    cos_Eg, sin_Eg = find_solstice_angle(ecc_list[:, None], shift_list[None, :])
+    x_sun = cx[:, 0, 0] + radius * ecc_list
+    x_sol = cx[:, :, 0] + radius * cos_Eg
+    y_sol = cy_top - radius * sin_Eg * b[:, None]
+    ax.scatter(
+        np.concatenate([x_sun, x_sol.ravel()]),
+        np.concatenate([np.full(n_cols, cy_top), y_sol.ravel()]),
+        s=[4.0**2] * n_cols + [2.0**2] * x_sol.size,
+        facecolors=["none"] * n_cols + ["k"] * x_sol.size,
+        edgecolors="k",
+        linewidths=1.0,
+        zorder=3,
+    )
+    # dd = 0.4
+    # xx = x + np.array([-pad, pad]) * x * dd
+    # yy = y + np.array([-pad, pad]) * y / b * dd
+    # ax.plot(cx + xx, cy_top + yy, ls="-", lw=0.5, color="k")
 
     ax.set_aspect("equal")
     ax.set_xlim(-size / 2.0, n_cols * size - size / 2.0)
@@ -491,5 +977,7 @@ if __name__ == "__main__":
     #     eps=45,
     #     ecc=0.75,
     #     shifts=np.linspace(0, 360, 180, endpoint=False),
-    #     path="./Analemma/data/"
+    #     path="./Analemma/data/",
+    #     fmt="bin",
+    #     block=32,
     # )
@@ -1,10 +1,13 @@
 import datetime
+
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 import matplotlib.ticker as ticker
-from scipy.interpolate import UnivariateSpline
+
+from kepler import true_anomaly
+from perihelion_angle import data as planet_data, planet_angles
 
 
 def set_ax_x(ax):
@@ -43,34 +46,6 @@ def format_shift(x, pos):
         return ""
 
 
-def compute_M_to_nu(ecc, tol=1e-12, max_iter=20):
-    M = np.linspace(0.0, 2 * np.pi, 1000)
-    E = M + ecc * np.sin(M)
-    it, max_delta = 0, 1.0
-    while it < max_iter and tol < max_delta:
-        f = E - ecc * np.sin(E) - M
-        df = 1 - ecc * np.cos(E)
-        E -= f / df
-        it += 1
-        max_delta = np.amax(np.abs(f / df))
-        print(f"Kepler equation : {it:2d} -> max delta={max_delta:.5e}")
-    r = 1 - ecc * np.cos(E)
-    sin_E = np.sin(E)
-    cos_E = np.cos(E)
-    cos_nu = (cos_E - ecc) / r
-    sin_nu = np.sqrt(1 - ecc * ecc) * sin_E / r
-    cos_nu_spline = UnivariateSpline(M, cos_nu, s=0)
-    sin_nu_spline = UnivariateSpline(M, sin_nu, s=0)
-    # x = np.linspace(0, 2 * np.pi, 5000)
-    # plt.plot(M, cos_nu, '.', label="cos(nu)")
-    # plt.plot(M, sin_nu, '.', label="sin(nu)")
-    # plt.plot(x, cos_nu_spline(x), label="cos(nu)")
-    # plt.plot(x, sin_nu_spline(x), label="sin(nu)")
-    # plt.show()
-    # exit()
-    return cos_nu_spline, sin_nu_spline
-
-
 def approx_noon_shift(ecc, cos_eps, gam, N, offset=0.0):
     M_civil = np.linspace(0, 2 * np.pi, N, endpoint=False) + np.pi / N
     M_astro = M_civil - offset * 2 * np.pi / N
@@ -84,36 +59,268 @@ def approx_noon_shift(ecc, cos_eps, gam, N, offset=0.0):
     return M_civil, approx1 / N, approx2 / N
 
 
-# Convergence is not guaranteed for all parameters !
-def solve_noon_shift(ecc, cos_eps, gam, N, offs=0.0, tol=1e-9, max_iter=100):
-    def f_df(M):
-        cg, sg = np.cos(gam), np.sin(gam)
-        c_nu, s_nu = cos_nu(M), sin_nu(M)
-        cos_nu_gam = c_nu * cg - s_nu * sg
-        sin_nu_gam = s_nu * cg + c_nu * sg
-        sin_th = np.sin(gam + (1 + N) * M)
-        cos_th = np.cos(gam + (1 + N) * M)
-        zeta = (1 + ecc * c_nu) * (1 + ecc * c_nu)
-        zeta /= (1 - ecc * ecc) * np.sqrt(1 - ecc * ecc)
-        f = cos_eps * cos_nu_gam * sin_th - sin_nu_gam * cos_th
-        df1 = ((1 + N) - zeta * cos_eps) * sin_nu_gam * sin_th
-        df2 = ((1 + N) * cos_eps - zeta) * cos_nu_gam * cos_th
-        return -f / (df1 + df2)
-
-    cos_nu, sin_nu = compute_M_to_nu(ecc)
+# Status of each element of solve_noon_shift
+NOON_CONVERGED = 0
+NOON_MAX_ITER = 1
+NOON_NO_BRACKET = 2
+
+
+def _noon_phase(M, alpha_ref, ecc, cos_eps, gam, N, phase=0.0):
+    # With phi = nu + gam and theta = gam + phase + (1 + N) M, the condition
+    #   cos(eps) cos(phi) sin(theta) - sin(phi) cos(theta) = 0
+    # reads A sin(psi) = 0 for the phase psi = theta - alpha, where
+    # alpha = atan2(sin(phi), cos(eps) cos(phi)) is taken within pi of
+    # alpha_ref, so that psi is smooth in M
+    c_nu, s_nu = true_anomaly(M, ecc)
+    cg, sg = np.cos(gam), np.sin(gam)
+    a = cos_eps * (c_nu * cg - s_nu * sg)
+    b = s_nu * cg + c_nu * sg
+    alpha = np.arctan2(b, a)
+    alpha = alpha_ref + (alpha - alpha_ref + np.pi) % (2 * np.pi) - np.pi
+    zeta = (1 + ecc * c_nu) * (1 + ecc * c_nu)
+    zeta /= (1 - ecc * ecc) * np.sqrt(1 - ecc * ecc)  # dnu / dM
+    psi = gam + phase + (1 + N) * M - alpha
+    dpsi = (1 + N) - cos_eps * zeta / (a * a + b * b)
+    return psi, dpsi, alpha
+
+
+def _solve_noon_phase(M0, ecc, cos_eps, gam, N, tol, max_iter, phase=0.0):
+    # Safeguarded Newton on psi(M) = k pi, k being the closest to psi(M0).
+    # Converged elements leave the active set; a step is clipped to a
+    # quarter of solar day, and replaced by a bisection when it leaves the
+    # bracket [lo, hi] of half a solar day around M0, shrunk at each pass.
+    # Parameters are scalars or arrays shaped as M0, one value per element.
+    ecc, cos_eps, gam, N, phase = (
+        np.broadcast_to(x, M0.shape) for x in (ecc, cos_eps, gam, N, phase)
+    )
+    psi0, _, alpha0 = _noon_phase(M0, 0.0, ecc, cos_eps, gam, N, phase)
+    target = np.pi * np.round(psi0 / np.pi)
+    half_day = np.pi / np.abs(1 + N)
+    lo, hi = M0 - half_day, M0 + half_day
+    g_lo = _noon_phase(lo, alpha0, ecc, cos_eps, gam, N, phase)[0] - target
+    g_hi = _noon_phase(hi, alpha0, ecc, cos_eps, gam, N, phase)[0] - target
+    bracketed = g_lo * g_hi < 0.0
+    increasing = np.where(bracketed, g_lo < 0.0, 0.0 < 1 + N)
+
+    M = M0.copy()
+    status = np.full(M.shape, NOON_MAX_ITER, dtype=np.int8)
+    status[~bracketed] = NOON_NO_BRACKET
+    iterations = np.zeros(M.shape, dtype=np.int16)
+    active = np.arange(M.size)
+    n_pass = 0
+    while n_pass < max_iter and active.size > 0:
+        Ma = M[active]
+        psi, dpsi, _ = _noon_phase(
+            Ma, alpha0[active], ecc[active], cos_eps[active], gam[active],
+            N[active], phase[active],
+        )
+        g = psi - target[active]
+        right = (g < 0.0) == increasing[active]
+        lo[active] = np.where(right, Ma, lo[active])
+        hi[active] = np.where(right, hi[active], Ma)
+
+        max_step = half_day[active] / 2
+        step = np.clip(-g / dpsi, -max_step, max_step)
+        new = Ma + step
+        outside = ~((lo[active] <= new) & (new <= hi[active]))
+        new[outside] = 0.5 * (lo[active] + hi[active])[outside]
+
+        M[active] = new
+        iterations[active] += 1
+        done = np.abs(new - Ma) < tol
+        status[active[done]] = NOON_CONVERGED
+        active = active[~done]
+        n_pass += 1
+    return M, status, iterations
+
+
+def solve_noon_shift(
+    ecc, cos_eps, gam, N, offs=0.0, tol=1e-9, max_iter=100, full_output=False
+):
+    """ Mean anomaly shift between the mean and the true solar noons.
+    Args:
+        ecc (float): eccentricity
+        cos_eps (float): cosine of the obliquity
+        gam (float): winter solstice to perihelion angle, in radians
+        N (int): number of solar days per year
+        offs (float, optional): year start to perihelion, in days
+        tol (float, optional): tolerance on the Newton updates
+        max_iter (int, optional): maximum number of passes
+        full_output (bool, optional): also return an info dict
+
+    Returns:
+        M_mean_civil (np.ndarray): mean anomaly at mean noon, for each day
+        shift (np.ndarray): true noon minus mean noon, in mean anomaly
+        info (dict): if full_output, per-day "status" (NOON_CONVERGED,
+            NOON_MAX_ITER or NOON_NO_BRACKET) and "iterations"
+    """
     M_mean_civil = np.linspace(0, 2 * np.pi, N, endpoint=False) + np.pi / N
     M_mean_astro = (M_mean_civil - offs * 2 * np.pi / N) % (2 * np.pi)
-    M_sol_noon = M_mean_astro.copy()
-    it, max_delta = 0, 1.0
-    while it < max_iter and tol < max_delta:
-        delta = f_df(M_sol_noon)  # 0.5
-        M_sol_noon = M_sol_noon + delta  # might wanna clip
-        max_delta = np.amax(np.abs(delta))
-        it += 1
-        print(f"Iteration {it:2d}: max delta = {max_delta:.5e}")
-    if it == max_iter:
-        print("Warning: Maximum iterations reached without convergence.")
-    return M_mean_civil, M_sol_noon - M_mean_astro
+    M_sol_noon, status, iterations = _solve_noon_phase(
+        M_mean_astro, ecc, cos_eps, gam, N, tol, max_iter
+    )
+    print(f"Noon shift : {np.amax(iterations):2d} passes")
+    if np.any(status != NOON_CONVERGED):
+        n_fail = np.count_nonzero(status != NOON_CONVERGED)
+        print(f"Warning: noon shift did not converge for {n_fail} days")
+    shift = M_sol_noon - M_mean_astro
+    if full_output:
+        return M_mean_civil, shift, dict(status=status, iterations=iterations)
+    return M_mean_civil, shift
+
+
+# Solar days per sidereal year of the bodies with a prograde rotation and
+# more than one solar day per year. Mercury (about half a solar day per
+# year), Venus and Uranus (retrograde) are left out
+SOLAR_DAYS = {
+    "Earth": 365.2422,
+    "Mars": 668.5991,
+    "Jupiter": 10475.6,
+    "Saturn": 24451.0,
+    "Neptune": 89667.0,
+}
+
+
+def default_bodies():
+    """ Parameters of the planets of SOLAR_DAYS, from perihelion_angle.
+    """
+    bodies = {}
+    for name, N in SOLAR_DAYS.items():
+        tilt, _, winter_to_peri = planet_angles(name)
+        bodies[name] = dict(
+            eps=tilt, ecc=planet_data[name]["e"], gam=winter_to_peri, N=N,
+            offset=0.0,
+        )
+    return pd.DataFrame.from_dict(bodies, orient="index")
+
+
+def noon_shift_table(bodies=None, tol=1e-9, max_iter=100):
+    """ Noon shift of every day of several bodies, solved at once.
+    Args:
+        bodies (pd.DataFrame or dict, optional): one row per body, indexed by
+            name, with columns eps (deg), ecc, gam (deg), N (solar days per
+            year, may be fractional) and optionally offset (days). Defaults
+            to default_bodies()
+        tol, max_iter (optional): as in solve_noon_shift
+
+    Returns:
+        table (pd.DataFrame): one row per body and day, with columns body,
+            day, M_mean (civil mean anomaly at mean noon), shift (in mean
+            anomaly), eot (true minus mean noon, in solar days), status
+            and iterations.
+    """
+    if bodies is None:
+        bodies = default_bodies()
+    elif isinstance(bodies, dict):
+        bodies = pd.DataFrame.from_dict(bodies, orient="index")
+    N = bodies["N"].to_numpy(dtype=float)
+    offset = bodies.get("offset", pd.Series(0.0, bodies.index)).to_numpy(float)
+    n_days = np.floor(N).astype(int)
+
+    # Flatten all the days of all the bodies
+    body = np.repeat(np.arange(len(bodies)), n_days)
+    start = np.cumsum(n_days) - n_days
+    day = np.arange(body.size) - start[body]
+    N_day = N[body]
+    M_mean_civil = 2 * np.pi * (day + 0.5) / N_day
+    M_mean_astro = (M_mean_civil - offset[body] * 2 * np.pi / N_day) % (2 * np.pi)
+
+    ecc = bodies["ecc"].to_numpy(dtype=float)[body]
+    cos_eps = np.cos(np.deg2rad(bodies["eps"].to_numpy(dtype=float)))[body]
+    gam = np.deg2rad(bodies["gam"].to_numpy(dtype=float))[body]
+    M_sol_noon, status, iterations = _solve_noon_phase(
+        M_mean_astro, ecc, cos_eps, gam, N_day, tol, max_iter
+    )
+    shift = M_sol_noon - M_mean_astro
+    n_fail = np.count_nonzero(status != NOON_CONVERGED)
+    if n_fail > 0:
+        print(f"Warning: noon shift did not converge for {n_fail} days")
+
+    return pd.DataFrame(
+        dict(
+            body=pd.Categorical.from_codes(body, categories=bodies.index),
+            day=day,
+            M_mean=M_mean_civil,
+            shift=shift,
+            eot=shift * N_day / (2 * np.pi),
+            status=status,
+            iterations=iterations,
+        )
+    )
+
+
+# Secular elements of the Earth, for T in Julian centuries from J2000
+# (J. Meeus, Astronomical Algorithms, 2nd ed., ch. 22 and 25)
+J2000 = 2451545.0
+EOT_DTYPE = np.dtype(
+    [
+        ("jd", "<f8"),  # Julian day of mean noon at Greenwich
+        ("eps", "<f4"),  # obliquity, in degrees
+        ("ecc", "<f4"),
+        ("gam", "<f4"),  # winter solstice to perihelion, in degrees
+        ("noon_shift", "<f8"),  # true minus mean noon, in minutes
+        ("status", "i1"),
+    ]
+)
+
+
+def earth_elements(T):
+    """ Obliquity, eccentricity, longitude of perihelion and mean anomaly,
+    angles in degrees, at T Julian centuries from J2000.
+    """
+    eps = 23.439291 - 0.0130042 * T
+    ecc = 0.016708634 - 0.000042037 * T - 0.0000001267 * T * T
+    peri = 102.937348 + 1.7195269 * T + 0.00045962 * T * T
+    M = 357.52911 + 35999.05029 * T - 0.0001537 * T * T
+    return eps, ecc, peri, M
+
+
+def secular_noon_shift(days, tol=1e-9, max_iter=100):
+    """ Noon shift of the Earth for days counted from J2000, with the
+    elements of each day. Returns a structured array of EOT_DTYPE.
+    """
+    days = np.asarray(days)
+    T = days / 36525.0
+    eps, ecc, peri, M = earth_elements(T)
+    gam = np.deg2rad(peri - 90.0) % (2 * np.pi)
+    M0 = np.deg2rad(M) % (2 * np.pi)
+    # Mean solar days per anomalistic year, from the rate of M
+    N = 360.0 * 36525.0 / (35999.05029 - 2 * 0.0001537 * T)
+    # Mean noon: the meridian faces the mean Sun, theta = gam + M0 + pi
+    phase = (np.pi - N * M0) % (2 * np.pi)
+
+    M_sol_noon, status, _ = _solve_noon_phase(
+        M0, ecc, np.cos(np.deg2rad(eps)), gam, N, tol, max_iter, phase
+    )
+    out = np.empty(days.shape, dtype=EOT_DTYPE)
+    out["jd"] = J2000 + days
+    out["eps"], out["ecc"], out["gam"] = eps, ecc, np.rad2deg(gam)
+    out["noon_shift"] = (M_sol_noon - M0) * N / (2 * np.pi) * 24 * 60
+    out["status"] = status
+    return out
+
+
+def iter_noon_shift(n_days, start=0, chunk=2**16, tol=1e-9, max_iter=100):
+    """ Stream secular_noon_shift over n_days consecutive days from J2000 +
+    start, by chunks of days, so that memory does not grow with n_days.
+    """
+    for first in range(start, start + n_days, chunk):
+        days = np.arange(first, min(first + chunk, start + n_days))
+        yield secular_noon_shift(days, tol, max_iter)
+
+
+def write_noon_shift(filename, n_days, start=0, chunk=2**16):
+    """ Write iter_noon_shift records to a raw EOT_DTYPE file, which can be
+    read back with np.fromfile(filename, dtype=EOT_DTYPE) or np.memmap.
+    """
+    n_fail = 0
+    with open(filename, "wb") as f:
+        for block in iter_noon_shift(n_days, start, chunk):
+            n_fail += np.count_nonzero(block["status"] != NOON_CONVERGED)
+            block.tofile(f)
+    if n_fail > 0:
+        print(f"Warning: noon shift did not converge for {n_fail} days")
+    return
 
 
 def anomaly_to_x(M, shift, N, D, dates):
@@ -207,6 +414,10 @@ def plot_noon_tilt(parameters, N: int, D: float, offset: int, dates=True):
 
 if __name__ == "__main__":
     plt.rcParams.update({"text.usetex": True})
+
+    # write_noon_shift("noon_shift_J2000.bin", n_days=10**7, start=-5 * 10**6)
+    # table = noon_shift_table()
+    # table.to_csv("./Analemma/noon_shift_planets.csv", index=False)
     # plot_noon_tilt(
     #     [(23.44, 0.0, 12.93), (85.00, 0.0, 12.93)],
     #     N=365,
@@ -0,0 +1,140 @@
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.widgets import Slider
+
+from draw_analemma import (
+    add_directions, approx_analemma, project_analemma, solve_kepler_grid,
+    solve_projected_analemma,
+)
+
+
+class AnalemmaExplorer:
+    """ Interactive analemma with sliders for eps, e, gamma and offset.
+
+    Slider events only record the new parameters. A timer running at the
+    display refresh rate recomputes the curves into preallocated buffers
+    and blits the animated artists over a cached background, so that at
+    most one redraw happens per refresh, whatever the number of events.
+    Kepler's equation is only solved again when ecc or offset change.
+    """
+
+    def __init__(self, eps=23.44, ecc=0.0167, gam=12.93, offset=0.0,
+                 n=20_000, n_colors=12, fps=60):
+        self.n = n
+        self.M = np.linspace(0, 2 * np.pi, n)
+        # Planet-Sun vectors and screen coordinates of the exact and
+        # approximated curves, and scratch buffers shared by the solvers
+        self.x_exact = np.empty((3, n))
+        self.x_approx = np.empty((3, n))
+        self.xy_exact = np.full((2, n), np.nan)
+        self.xy_approx = np.full((2, n), np.nan)
+        self.work = {}
+        # Eccentric anomalies, which only change with ecc and offset
+        self.E, self.E_key = None, None
+
+        self.fig = plt.figure(figsize=(7, 8))
+        self.ax = self.fig.add_axes([0.05, 0.25, 0.9, 0.72])
+        self.ax.set_aspect("equal")
+        self.ax.set_xlim(-1.2, 1.2)
+        self.ax.set_ylim(-1.2, 1.2)
+        self.ax.axis("off")
+        t = np.linspace(0, 2 * np.pi, 361)
+        self.ax.plot(np.cos(t), np.sin(t), color="k", lw=0.5, alpha=0.5)
+        add_directions(self.ax)
+
+        # One line per month, each a view on the same buffer
+        colors = plt.get_cmap("turbo")(np.linspace(0.0, 1.0, n_colors))
+        bounds = np.linspace(0, n - 1, n_colors + 1).astype(int)
+        self.months = [slice(a, b + 1) for a, b in zip(bounds[:-1], bounds[1:])]
+        self.approx_line, = self.ax.plot(
+            [], [], color="grey", lw=0.75, animated=True
+        )
+        self.exact_lines = [
+            self.ax.plot([], [], color=c, lw=2.0, animated=True)[0]
+            for c in colors
+        ]
+
+        self.sliders = {}
+        specs = [
+            ("eps", r"$\epsilon$ [deg]", 0.0, 90.0, eps),
+            ("ecc", r"$e$", 0.0, 0.95, ecc),
+            ("gam", r"$\gamma$ [deg]", 0.0, 360.0, gam),
+            ("offset", "offset", 0.0, 1.0, offset),
+        ]
+        for i, (name, label, vmin, vmax, valinit) in enumerate(specs):
+            ax_slider = self.fig.add_axes([0.2, 0.17 - 0.045 * i, 0.6, 0.03])
+            slider = Slider(ax_slider, label, vmin, vmax, valinit=valinit)
+            slider.drawon = False
+            slider.on_changed(self.on_changed)
+            self.sliders[name] = slider
+
+        self.background = None
+        self.pending = True
+        self.fig.canvas.mpl_connect("draw_event", self.on_draw)
+        self.timer = self.fig.canvas.new_timer(interval=int(1000 / fps))
+        self.timer.add_callback(self.on_timer)
+        self.timer.start()
+
+    def on_changed(self, _):
+        self.pending = True
+        return
+
+    def on_draw(self, _):
+        self.background = self.fig.canvas.copy_from_bbox(self.ax.bbox)
+        self.update_curves()
+        self.draw_animated()
+        return
+
+    def on_timer(self):
+        if self.pending and self.background is not None:
+            self.pending = False
+            self.update_curves()
+            self.fig.canvas.restore_region(self.background)
+            self.draw_animated()
+            self.fig.canvas.blit(self.ax.bbox)
+            for slider in self.sliders.values():
+                self.fig.draw_artist(slider.ax)
+                self.fig.canvas.blit(slider.ax.bbox)
+            self.fig.canvas.flush_events()
+        return
+
+    def update_curves(self):
+        eps = np.deg2rad(self.sliders["eps"].val)
+        ecc = self.sliders["ecc"].val
+        gam = np.deg2rad(self.sliders["gam"].val)
+        offset = self.sliders["offset"].val
+
+        if self.E_key != (ecc, offset):
+            self.E_key = (ecc, offset)
+            self.E = solve_kepler_grid(ecc, self.M, offset=offset, work=self.work)
+        solve_projected_analemma(
+            eps, ecc, gam, self.M, offset=offset, out=self.x_exact, work=self.work,
+            E=self.E,
+        )
+        approx_analemma(
+            eps, ecc, gam, self.M, offset=offset, out=self.x_approx, work=self.work
+        )
+        project_analemma(*self.x_approx, work=self.work)
+        for x, xy in [(self.x_exact, self.xy_exact), (self.x_approx, self.xy_approx)]:
+            np.negative(x[1], out=xy[0])
+            np.copyto(xy[1], x[2])
+
+        self.approx_line.set_data(self.xy_approx[0], self.xy_approx[1])
+        for line, month in zip(self.exact_lines, self.months):
+            line.set_data(self.xy_exact[0, month], self.xy_exact[1, month])
+        return
+
+    def draw_animated(self):
+        self.ax.draw_artist(self.approx_line)
+        for line in self.exact_lines:
+            self.ax.draw_artist(line)
+        return
+
+
+if __name__ == "__main__":
+    explorer = AnalemmaExplorer()
+    start = time.perf_counter()
+    explorer.update_curves()
+    print(f"Curve update: {1e3 * (time.perf_counter() - start):.1f} ms")
+    plt.show()
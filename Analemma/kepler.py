@@ -0,0 +1,101 @@
+import numpy as np
+
+# Markley's starter, see F. L. Markley, "Kepler equation solver",
+# Celestial Mechanics and Dynamical Astronomy 63, 101-111 (1995).
+_ALPHA_0 = 3 * np.pi * np.pi / (np.pi * np.pi - 6)
+_ALPHA_1 = 1.6 * np.pi / (np.pi * np.pi - 6)
+
+
+def solve_kepler(M, ecc, tol=1e-12, max_iter=3):
+    """ Solve Kepler's equation E - e sin(E) = M for any 0 <= e < 1.
+    Args:
+        M (np.ndarray): mean anomaly, in radians
+        ecc (float or np.ndarray): eccentricity, broadcastable with M
+        tol (float, optional): tolerance on the correction of E, raised to
+            16 ulps of the working precision if smaller
+        max_iter (int, optional): maximum number of correction passes
+
+    The computation is done in float32 if both M and ecc are float32 arrays,
+    in float64 otherwise.
+
+    Returns:
+        E (np.ndarray): eccentric anomaly, in radians
+        it (np.ndarray): number of correction passes for each element
+    """
+    M, ecc = np.asarray(M), np.asarray(ecc)
+    dtype = np.result_type(M.dtype, ecc.dtype, np.float32)
+    M, ecc = np.broadcast_arrays(
+        np.asarray(M, dtype=dtype), np.asarray(ecc, dtype=dtype)
+    )
+    assert np.all((0.0 <= ecc) & (ecc < 1.0))
+    tol = max(tol, 16 * np.finfo(dtype).eps)
+
+    # Reduce to M in [0, pi], the solution being odd and 2pi-periodic
+    turns = np.round(M / (2 * np.pi))
+    m = M - 2 * np.pi * turns
+    sign = np.copysign(1, m)
+    m = np.abs(m)
+
+    # Cubic starter, accurate to ~1e-4 for all (e, M)
+    alpha = _ALPHA_0 + _ALPHA_1 * (np.pi - m) / (1 + ecc)
+    d = 3 * (1 - ecc) + alpha * ecc
+    q = 2 * alpha * d * (1 - ecc) - m * m
+    r = 3 * alpha * d * (d - 1 + ecc) * m + m * m * m
+    w = np.cbrt(np.abs(r) + np.sqrt(q * q * q + r * r)) ** 2
+    E = (2 * r * w / (w * w + w * q + q * q) + m) / d
+
+    # Fifth-order corrections, applied to the elements still off
+    E = E.ravel()
+    m = m.ravel()
+    e = ecc.ravel()
+    it = np.zeros(E.size, dtype=np.int8)
+    active = np.arange(E.size)
+    n_pass = 0
+    while n_pass < max_iter and active.size > 0:
+        delta = _correction(E[active], e[active], m[active])
+        E[active] += delta
+        it[active] += 1
+        active = active[tol < np.abs(delta)]
+        n_pass += 1
+    if active.size > 0:
+        print("Warning: did not converge in solve_kepler")
+
+    E = sign * E.reshape(M.shape) + 2 * np.pi * turns
+    return E, it.reshape(M.shape)
+
+
+def _correction(E, e, M):
+    # Householder step of order 5 (Markley 1995, eq. 21-25)
+    se, ce = e * np.sin(E), e * np.cos(E)
+    f0 = E - se - M
+    f1 = 1 - ce
+    f2 = se
+    f3 = ce
+    d3 = -f0 / (f1 - 0.5 * f0 * f2 / f1)
+    d4 = -f0 / (f1 + 0.5 * d3 * f2 + d3 * d3 * f3 / 6)
+    d5 = -f0 / (f1 + 0.5 * d4 * f2 + d4 * d4 * f3 / 6 - d4 * d4 * d4 * f2 / 24)
+    return d5
+
+
+def eccentric_to_true(E, ecc):
+    """ Convert the eccentric anomaly to the true anomaly.
+    Args:
+        E (np.ndarray): eccentric anomaly, in radians
+        ecc (float or np.ndarray): eccentricity, broadcastable with E
+
+    Returns:
+        r (np.ndarray): Planet-Sun distance, in units of semi-major axis
+        cos_nu, sin_nu (np.ndarray): cosine and sine of the true anomaly
+    """
+    r = 1 - ecc * np.cos(E)
+    cos_nu = (np.cos(E) - ecc) / r
+    sin_nu = np.sqrt(1 - ecc * ecc) * np.sin(E) / r
+    return r, cos_nu, sin_nu
+
+
+def true_anomaly(M, ecc, tol=1e-12, max_iter=3):
+    """ Cosine and sine of the true anomaly, for any mean anomaly M.
+    """
+    E, _ = solve_kepler(M, ecc, tol, max_iter)
+    _, cos_nu, sin_nu = eccentric_to_true(E, ecc)
+    return cos_nu, sin_nu
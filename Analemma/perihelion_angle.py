@@ -1,18 +1,22 @@
 import numpy as np
 from numpy import pi
 
-def R(ax: int, theta: float) -> np.ndarray:
+def R(ax: int, theta) -> np.ndarray:
+    """ Rotation matrices of angles theta, shape theta.shape + (3, 3).
+    """
     c = np.cos(theta)
     s = np.sin(theta)
+    o, z = np.ones_like(c), np.zeros_like(c)
 
     if ax == 1:  # Rotation around x-axis
-        return np.array([[1, 0, 0], [0, c, s], [0, -s, c]])
+        rows = [[o, z, z], [z, c, s], [z, -s, c]]
     elif ax == 2:  # Rotation around y-axis
-        return np.array([[c, 0, -s], [0, 1, 0], [s, 0, c]])
+        rows = [[c, z, -s], [z, o, z], [s, z, c]]
     elif ax == 3:  # Rotation around z-axis
-        return np.array([[c, s, 0], [-s, c, 0], [0, 0, 1]])
+        rows = [[c, s, z], [-s, c, z], [z, z, o]]
     else:
         raise ValueError("Axis must be 1 (x), 2 (y), or 3 (z).")
+    return np.stack([np.stack(row, axis=-1) for row in rows], axis=-2)
 
 
 e = np.deg2rad(23.43928108)  # Earth Obliquity of the ecliptic
@@ -104,48 +108,180 @@ data = {
     }
 }
 
-# planet = "Mercury"
-# planet = "Venus"
-# planet = "Earth"
-planet = "Mars"
-# planet = "Jupiter"
-# planet = "Saturn"
-# planet = "Uranus"
-# planet = "Neptune"
-a = np.deg2rad(data[planet]["a"])  # North pole right ascension
-d = np.deg2rad(data[planet]["d"])  # North pole declination
-O = np.deg2rad(data[planet]["O"])  # Longitude of the ascending node
-i = np.deg2rad(data[planet]["i"])  # Orbit inclination
-w = np.deg2rad(data[planet]["w"])  # Longitude of periapsis
-w -= O  # Argument of periapsis
-tilt_soluce = data[planet].get("tilt_soluce", None)
-lambda_soluce = data[planet].get("lambda_soluce", None)
-
-RD = R(2, d)
-RA = R(3, -a)
-RE = R(1, e)
-RO = R(3, O)
-RI = R(1, i)
-RW = R(3, w)
-
-v = RW @ RI @ RO @ RE @ RA @ RD @ np.array([1, 0, 0])
-w1, w2, w3 = v
-w = np.hypot(w1, w2)
-estimated_tilt = np.arccos(w3)
-sinb = +w1 / w
-cosb = -w2 / w
-beta = np.arctan2(sinb, cosb)
-peri_to_vernal = np.rad2deg(beta)
-vernal_to_peri = (360 - peri_to_vernal) % 360
-winter_to_peri = (90 - peri_to_vernal) % 360
-
-print(f"Solution for {planet} (in degrees):")
-
-print(f"Computed tilt: {np.rad2deg(estimated_tilt):7.4f}")
-if tilt_soluce is not None:
-    print(f"Expected tilt: {tilt_soluce:7.4f}")
-
-print(f"Computed angle from vernal equinox to perihelion: {vernal_to_peri:7.4f}")
-if lambda_soluce is not None:
-    print(f"Expected angle from vernal equinox to perihelion: {lambda_soluce:7.4f}")
-print(f"Computed angle from winter solst.  to perihelion: {winter_to_peri:7.4f}")
+# Rates per Julian century of the elements above: JPL Table 2a (3000 BC -
+# 3000 AD) for the orbits, IAU 2009 secular terms for the poles. Earth's
+# orbit is the J2000 ecliptic at J2000, and moves out of it with the EM
+# barycenter rates, which drives the drift of its obliquity. Only the linear
+# terms of the poles of Jupiter and Neptune are kept.
+rates = {
+    "Mercury": {"e": 0.00002123, "i": -0.00590158, "w": 0.15940013,
+                "O": -0.12214182, "a": -0.0328, "d": -0.0049},
+    "Venus": {"e": -0.00005107, "i": 0.00043494, "w": 0.05679648,
+              "O": -0.27274174, "a": 0.0, "d": 0.0},
+    "Earth": {"e": -0.00003661, "i": -0.01337178, "w": 0.31795260,
+              "O": -0.24123856, "a": -0.641, "d": -0.557},
+    "Mars": {"e": 0.00009149, "i": -0.00724757, "w": 0.45223625,
+             "O": -0.26852431, "a": -0.1061, "d": -0.0609},
+    "Jupiter": {"e": 0.00018026, "i": -0.00322699, "w": 0.18199196,
+                "O": 0.13024619, "a": -0.006499, "d": 0.002413},
+    "Saturn": {"e": -0.00032044, "i": 0.00451969, "w": 0.54179478,
+               "O": -0.25015002, "a": -0.036, "d": -0.004},
+    "Uranus": {"e": -0.00001550, "i": -0.00180155, "w": 0.09266985,
+               "O": 0.05739699, "a": 0.0, "d": 0.0},
+    "Neptune": {"e": 0.00000818, "i": 0.00022400, "w": 0.01009938,
+                "O": -0.00606302, "a": 0.0, "d": 0.0},
+}
+
+# Approximate 1-sigma uncertainties of the elements above, in degrees: IAU
+# 2009 pole uncertainties where given, and the accuracy of the JPL fits for
+# the orbits. Earth's elements are taken as exact.
+sigmas = {
+    "Mercury": {"a": 0.0048, "d": 0.0028, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+    "Venus": {"a": 0.02, "d": 0.02, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+    "Earth": {"a": 0.0, "d": 0.0, "O": 0.0, "i": 0.0, "w": 0.0},
+    "Mars": {"a": 0.0005, "d": 0.0005, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+    "Jupiter": {"a": 0.0005, "d": 0.0005, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+    "Saturn": {"a": 0.01, "d": 0.01, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+    "Uranus": {"a": 0.05, "d": 0.05, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+    "Neptune": {"a": 0.01, "d": 0.01, "O": 1e-4, "i": 1e-4, "w": 1e-3},
+}
+
+
+def elements(planets, T=0.0):
+    """ Elements of `planets` at T Julian centuries from J2000, in degrees
+    (eccentricity excepted), each of shape (n_planets,) + T.shape.
+    """
+    T = np.asarray(T, dtype=float)
+    return {
+        key: np.stack([data[p][key] + rates[p][key] * T for p in planets])
+        for key in "eiwOad"
+    }
+
+
+def _pole_angles(a, d, O, i, w, chunk=2**16):
+    # Tilt and perihelion to vernal equinox angle, in radians, from the
+    # elements in radians, each of shape (n_planets, n)
+    n = a.shape[1]
+    tilt, beta = np.empty(a.shape), np.empty(a.shape)
+    for start in range(0, n, chunk):
+        sl = slice(start, start + chunk)
+        a_, d_, O_, i_, w_ = (x[:, sl] for x in (a, d, O, i, w))
+        # Pole direction R(3, w - O) R(1, i) R(3, O) R(1, e) R(3, -a) R(2, d) e_x,
+        # applied right to left on the vector
+        v = R(2, d_)[..., :, 0]
+        for M in [R(3, -a_), R(1, e), R(3, O_), R(1, i_), R(3, w_ - O_)]:
+            v = np.einsum("...ij,...j->...i", M, v)
+        w1, w2, w3 = v[..., 0], v[..., 1], v[..., 2]
+        tilt[:, sl] = np.arccos(np.clip(w3, -1.0, 1.0))
+        beta[:, sl] = np.arctan2(w1, -w2)
+    return tilt, beta
+
+
+def planet_orientation(planets=None, T=0.0, chunk=2**16):
+    """ Obliquity and perihelion angles of planets at several epochs.
+    Args:
+        planets (list, optional): planet names, defaults to all of `data`
+        T (np.ndarray, optional): epochs in Julian centuries from J2000
+        chunk (int, optional): epochs per batch of rotation matrices
+
+    Returns:
+        tilt, vernal_to_peri, winter_to_peri (np.ndarray): angles in
+            degrees, of shape (n_planets,) + T.shape.
+    """
+    planets = list(data) if planets is None else list(planets)
+    T = np.asarray(T, dtype=float)
+    el = {
+        key: np.deg2rad(x).reshape(len(planets), -1)
+        for key, x in elements(planets, T).items() if key != "e"
+    }
+    tilt, beta = _pole_angles(*(el[key] for key in "adOiw"), chunk=chunk)
+    shape = (len(planets),) + T.shape
+    peri_to_vernal = np.rad2deg(beta).reshape(shape)
+    vernal_to_peri = (360 - peri_to_vernal) % 360
+    winter_to_peri = (90 - peri_to_vernal) % 360
+    return np.rad2deg(tilt).reshape(shape), vernal_to_peri, winter_to_peri
+
+
+def planet_angles(planet):
+    """ Obliquity and perihelion angles of a planet at J2000, in degrees.
+    Returns:
+        tilt (float): angle between the orbit and equator planes
+        vernal_to_peri (float): vernal equinox to perihelion angle
+        winter_to_peri (float): winter solstice to perihelion angle
+    """
+    angles = planet_orientation([planet])
+    return tuple(float(x[0]) for x in angles)
+
+
+def monte_carlo_orientation(planet, n=10**6, T=0.0, sigma=None, seed=0,
+                            q=(2.5, 50.0, 97.5), chunk=2**16):
+    """ Propagate the uncertainties of the pole and orbit of a planet to its
+    tilt and winter solstice to perihelion angle, with n normal samples.
+    Args:
+        planet (str): planet name
+        n (int, optional): number of samples
+        T (float, optional): epoch in Julian centuries from J2000
+        sigma (dict, optional): 1-sigma of "a", "d", "O", "i", "w" in degrees,
+            defaults to sigmas[planet]
+        seed (int, optional): seed of the random generator
+        q (tuple, optional): percentiles to report
+        chunk (int, optional): samples per batch of rotation matrices
+
+    Returns:
+        tilt, winter_to_peri (np.ndarray): percentiles q of both angles,
+            in degrees. The angle is wrapped around its nominal value before
+            taking percentiles, so that intervals across 0 stay contiguous.
+    """
+    sigma = sigmas[planet] if sigma is None else sigma
+    rng = np.random.default_rng(seed)
+    el = elements([planet], T)
+    samples = {
+        key: np.deg2rad(
+            el[key].reshape(1, 1) + sigma.get(key, 0.0) * rng.standard_normal((1, n))
+        )
+        for key in "adOiw"
+    }
+    tilt, beta = _pole_angles(*(samples[key] for key in "adOiw"), chunk=chunk)
+    winter_to_peri = 90 - np.rad2deg(beta[0])
+
+    _, _, nominal = planet_orientation([planet], T)
+    nominal = float(nominal[0])
+    winter_to_peri -= nominal
+    winter_to_peri += 180
+    np.mod(winter_to_peri, 360, out=winter_to_peri)
+    winter_to_peri -= 180
+    return (
+        np.percentile(np.rad2deg(tilt[0]), q),
+        (nominal + np.percentile(winter_to_peri, q)) % 360,
+    )
+
+
+if __name__ == "__main__":
+    # planet = "Mercury"
+    # planet = "Venus"
+    # planet = "Earth"
+    planet = "Mars"
+    # planet = "Jupiter"
+    # planet = "Saturn"
+    # planet = "Uranus"
+    # planet = "Neptune"
+    tilt_soluce = data[planet].get("tilt_soluce", None)
+    lambda_soluce = data[planet].get("lambda_soluce", None)
+    estimated_tilt, vernal_to_peri, winter_to_peri = planet_angles(planet)
+
+    print(f"Solution for {planet} (in degrees):")
+
+    print(f"Computed tilt: {estimated_tilt:7.4f}")
+    if tilt_soluce is not None:
+        print(f"Expected tilt: {tilt_soluce:7.4f}")
+
+    print(f"Computed angle from vernal equinox to perihelion: {vernal_to_peri:7.4f}")
+    if lambda_soluce is not None:
+        print(f"Expected angle from vernal equinox to perihelion: {lambda_soluce:7.4f}")
+    print(f"Computed angle from winter solst.  to perihelion: {winter_to_peri:7.4f}")
+
+    tilt_ci, winter_ci = monte_carlo_orientation(planet)
+    print("95% interval of tilt: [{:7.4f}, {:7.4f}]".format(tilt_ci[0], tilt_ci[2]))
+    print("95% interval of winter solst. to perihelion: [{:7.4f}, {:7.4f}]".format(
+        winter_ci[0], winter_ci[2]
+    ))
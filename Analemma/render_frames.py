@@ -0,0 +1,162 @@
+import time
+import shutil
+import subprocess
+import multiprocessing as mp
+
+import numpy as np
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from PIL import Image
+
+from draw_analemma import (
+    approx_analemma, project_analemma, solve_projected_analemma
+)
+
+BACKGROUND = "#3a3a3a"
+EXACT_COLOR = "#8ecae6"
+APPROX_COLOR = "#f4a582"
+
+# Figure of the current process, built once by _init_worker
+_frame = {}
+
+
+def _init_worker(eps, ecc, n, size, dpi):
+    width, height = size
+    fig = plt.figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+    fig.patch.set_facecolor(BACKGROUND)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_facecolor(BACKGROUND)
+    ax.set_aspect("equal")
+    ax.set_xlim(-1.0, 1.0)
+    ax.set_ylim(-1.0 * height / width, 1.0 * height / width)
+    ax.axis("off")
+
+    # Artists are created once, frames only update their data
+    lc_approx = LineCollection([], colors=APPROX_COLOR, linewidths=2.0)
+    lc_exact = LineCollection([], colors=EXACT_COLOR, linewidths=2.0)
+    ax.add_collection(lc_approx)
+    ax.add_collection(lc_exact)
+
+    _frame.update(
+        fig=fig, lc_exact=lc_exact, lc_approx=lc_approx, eps=eps, ecc=ecc,
+        M=np.linspace(0, 2 * np.pi, n + 1), size=size,
+    )
+    return
+
+
+def _segments(x1, x2, x3):
+    points = np.stack([-x2, x3], axis=-1)
+    return np.stack([points[:-1], points[1:]], axis=1)
+
+
+def _render(shift):
+    eps, ecc, M = _frame["eps"], _frame["ecc"], _frame["M"]
+    g = np.deg2rad(shift) % (2 * np.pi)
+    exact = solve_projected_analemma(eps, ecc, g, M)
+    approx = approx_analemma(eps, ecc, g, M)
+    project_analemma(*approx)
+    _frame["lc_exact"].set_segments(_segments(*exact))
+    _frame["lc_approx"].set_segments(_segments(*approx))
+    canvas = _frame["fig"].canvas
+    canvas.draw()
+    rgba = np.asarray(canvas.buffer_rgba())
+    return np.ascontiguousarray(rgba[..., :3]).tobytes()
+
+
+class _FFMpegWriter:
+    # Pipe raw RGB frames to ffmpeg, for .mp4 or .gif outputs
+    def __init__(self, filename, size, fps):
+        cmd = [
+            shutil.which("ffmpeg") or matplotlib.rcParams["animation.ffmpeg_path"],
+            "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "rgb24",
+            "-s", f"{size[0]}x{size[1]}", "-r", str(fps), "-i", "-",
+        ]
+        if filename.endswith(".gif"):
+            cmd += [
+                "-filter_complex", "split[a][b];[a]palettegen[p];[b][p]paletteuse",
+                "-loop", "0",
+            ]
+        else:
+            cmd += ["-pix_fmt", "yuv420p", "-vcodec", "libx264"]
+        self.proc = subprocess.Popen(cmd + [filename], stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.proc.stdin.write(frame)
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+class _PillowGifWriter:
+    # Fallback without ffmpeg: palette images are kept until the end,
+    # which costs one byte per pixel and frame
+    def __init__(self, filename, size, fps):
+        self.filename, self.size, self.fps = filename, size, fps
+        self.images = []
+
+    def write(self, frame):
+        image = Image.frombuffer("RGB", self.size, frame, "raw", "RGB", 0, 1)
+        self.images.append(image.quantize(colors=64))
+
+    def close(self):
+        first, *others = self.images
+        first.save(
+            self.filename, save_all=True, append_images=others,
+            duration=int(round(1000 / self.fps)), loop=0,
+        )
+
+
+def render_animation(
+    filename, eps, ecc, shifts, n=1200, size=(450, 480), dpi=100, fps=25,
+    n_workers=None,
+):
+    """ Render the exact and approximated analemmas for every phase shift.
+    Args:
+        filename (str): output .gif or .mp4 file (.mp4 requires ffmpeg)
+        eps (float): obliquity, in degrees
+        ecc (float): eccentricity
+        shifts (np.ndarray): phase shifts, in degrees, one per frame
+        n (int, optional): number of segments per curve
+        size (tuple, optional): frame size in pixels
+        n_workers (int, optional): number of rendering processes
+
+    Frames are rendered in a process pool, each worker reusing its own
+    figure, and streamed in order to the encoder without intermediate files.
+    """
+    initargs = (np.deg2rad(eps), ecc, n, size, dpi)
+    if shutil.which("ffmpeg"):
+        writer = _FFMpegWriter(filename, size, fps)
+    elif filename.endswith(".gif"):
+        writer = _PillowGifWriter(filename, size, fps)
+    else:
+        raise RuntimeError("ffmpeg is required to write videos")
+
+    n_workers = n_workers or mp.cpu_count()
+    try:
+        if n_workers == 1:
+            _init_worker(*initargs)
+            for frame in map(_render, shifts):
+                writer.write(frame)
+        else:
+            with mp.Pool(n_workers, _init_worker, initargs) as pool:
+                for frame in pool.imap(_render, shifts, chunksize=4):
+                    writer.write(frame)
+    finally:
+        writer.close()
+    return
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    render_animation(
+        "./Analemma/anim_matplotlib.gif",
+        eps=35.0,
+        ecc=0.1,
+        shifts=np.linspace(0, 360, 360, endpoint=False),
+    )
+    print(f"Rendered 360 frames in {time.perf_counter() - start:.2f} s")
@@ -1,3 +1,5 @@
+import os
+import warnings
 import datetime
 import numpy as np
 import pandas as pd
@@ -9,44 +11,259 @@ from matplotlib.colors import Normalize
 from matplotlib.patches import Patch
 from scipy.interpolate import UnivariateSpline
 
+from draw_analemma import solve_analemma
+
+
+# Columns of the ephemeris tables given as "HHhMM", loaded as minutes. The
+# other columns are day, month, and floats (angles, distance). Optional
+# "year" and "site" columns allow several years and sites in one file.
+TIME_COLUMNS = (
+    "sunrise", "sunset", "noon", "astr_start", "astr_end",
+    "naut_start", "naut_end", "civ_start", "civ_end",
+)
+CACHE_VERSION = 1
+
+# Altitudes of the Sun center at the start and end times of model_tables, in
+# degrees: sunrise and sunset with refraction and the Sun radius, then the
+# civil, nautical and astronomical twilights
+TWILIGHTS = {
+    ("sunrise", "sunset"): -0.833,
+    ("civ_start", "civ_end"): -6.0,
+    ("naut_start", "naut_end"): -12.0,
+    ("astr_start", "astr_end"): -18.0,
+}
+AU = 149.5978707  # in millions of km, the unit of "sun_distance"
+
+
+def parse_minutes(values):
+    """ Minutes since midnight of "HHhMM" strings, in one vectorized pass
+    over their bytes.
+    """
+    raw = np.ascontiguousarray(values, dtype="S5")
+    digits = raw.view(np.uint8).reshape(raw.size, 5).astype(np.int32)
+    if np.any(digits[:, 2] != ord("h")):
+        raise ValueError("times must be formatted as HHhMM")
+    digits -= ord("0")
+    return (digits[:, 0] * 10 + digits[:, 1]) * 60 + digits[:, 3] * 10 + digits[:, 4]
+
+
+def _table_dtype(names):
+    # Structured dtype of a row: times kept as their 5 raw bytes
+    def field(name):
+        if name in TIME_COLUMNS:
+            return "S5"
+        if name == "site":
+            return "U64"
+        if name in ("day", "month", "year"):
+            return "i4"
+        return "f8"
+    return np.dtype([(name, field(name)) for name in names])
+
+
+def _parse_chunk(rows, year, sites):
+    # Compact columns of a chunk of rows, site names mapped to codes
+    columns = {}
+    names = rows.dtype.names
+    years = rows["year"] if "year" in names else np.full(rows.size, year)
+    months = np.asarray(years - 1970, dtype="datetime64[Y]").astype("datetime64[M]")
+    days = (months + (rows["month"] - 1)).astype("datetime64[D]")
+    for name in names:
+        if name in TIME_COLUMNS:
+            columns[name] = parse_minutes(rows[name])
+        elif name == "site":
+            unique, inverse = np.unique(rows[name], return_inverse=True)
+            codes = [sites.setdefault(site, len(sites)) for site in unique]
+            columns[name] = np.array(codes, dtype=np.int32)[inverse]
+        elif name not in ("day", "month", "year"):
+            columns[name] = rows[name]
+    columns["date"] = days + (rows["day"] - 1)
+    return columns
+
+
+def read_columns(filename, year=2025, chunksize=2**18):
+    """ Read an ephemeris table chunk by chunk, so that only one chunk of
+    text is held in memory next to the compact columns.
+    Args:
+        filename (str): space separated table with a header line
+        year (int, optional): year of the dates if there is no "year" column
+        chunksize (int, optional): rows per chunk
+
+    Returns:
+        columns (dict): name -> np.ndarray, times in minutes, dates as
+            datetime64[D], and sites as codes into columns["site_names"]
+    """
+    sites, parts = {}, []
+    with open(filename, "rb") as f:
+        dtype = _table_dtype(f.readline().decode().split())
+        with warnings.catch_warnings():
+            # loadtxt warns on the empty read past the last full chunk
+            warnings.simplefilter("ignore", UserWarning)
+            while True:
+                rows = np.loadtxt(f, dtype=dtype, max_rows=chunksize, ndmin=1)
+                if rows.size > 0:
+                    parts.append(_parse_chunk(rows, year, sites))
+                if rows.size < chunksize:
+                    break
+    columns = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    if sites:
+        columns["site_names"] = np.array(list(sites))
+    return columns
+
+
+def _stamp(filename, year):
+    # Cache key: the cache is stale as soon as the table is modified
+    stat = os.stat(filename)
+    return np.array(
+        [CACHE_VERSION, stat.st_mtime_ns, stat.st_size, year], dtype=np.int64
+    )
 
-def to_num(t):
-    return t.dt.hour * 60 + t.dt.minute
-
-
-def load_data(filename):
-    df = pd.read_csv(filename, sep=" ", skipinitialspace=True, index_col=False)
-    days = df["day"].astype(int)
-    months = df["month"].astype(int)
-    year = 2025
 
-    df["date"] = pd.to_datetime(
-        {"year": year, "month": months, "day": days}, format="%Y-%m-%d"
+def load_columns(filename, year=2025, cache=True, chunksize=2**18):
+    """ Columns of an ephemeris table (see read_columns), reloaded from a
+    binary cache `filename + ".npz"`, written on the first call and rebuilt
+    whenever the table changes.
+    """
+    stamp = _stamp(filename, year)
+    cache_name = filename + ".npz"
+    if cache and os.path.exists(cache_name):
+        with np.load(cache_name) as data:
+            if np.array_equal(data["_stamp"], stamp):
+                return {name: data[name] for name in data.files if name != "_stamp"}
+
+    columns = read_columns(filename, year, chunksize)
+    if cache:
+        np.savez(cache_name, _stamp=stamp, **columns)
+    return columns
+
+
+def load_data(filename, year=2025, cache=True, chunksize=2**18):
+    """ Single and duplicated tables of an ephemeris file, see load_columns
+    and step_frames. With a "site" column, the rows of each site are
+    duplicated separately, so that no step spans two sites.
+    """
+    columns = load_columns(filename, year, cache, chunksize)
+    columns["date"] = columns["date"].astype("datetime64[us]")
+    if "site" not in columns:
+        return step_frames(pd.DataFrame(columns))
+
+    columns["site"] = pd.Categorical.from_codes(
+        columns["site"], columns.pop("site_names")
     )
+    df = pd.DataFrame(columns)
+    groups = df.groupby("site", observed=True, sort=False)
+    df2 = pd.concat([step_frames(group)[1] for _, group in groups], ignore_index=True)
+    return df, df2
 
-    df.drop(columns=["day", "month"], inplace=True)
-    df["sunrise"] = to_num(pd.to_datetime(df["sunrise"], format="%Hh%M"))
-    df["sunset"] = to_num(pd.to_datetime(df["sunset"], format="%Hh%M"))
-    df["noon"] = to_num(pd.to_datetime(df["noon"], format="%Hh%M"))
-    df["astr_start"] = to_num(pd.to_datetime(df["astr_start"], format="%Hh%M"))
-    df["astr_end"] = to_num(pd.to_datetime(df["astr_end"], format="%Hh%M"))
-    df["naut_start"] = to_num(pd.to_datetime(df["naut_start"], format="%Hh%M"))
-    df["naut_end"] = to_num(pd.to_datetime(df["naut_end"], format="%Hh%M"))
-    df["civ_start"] = to_num(pd.to_datetime(df["civ_start"], format="%Hh%M"))
-    df["civ_end"] = to_num(pd.to_datetime(df["civ_end"], format="%Hh%M"))
-
-    df["sunrise_angle"] = df["sunrise_angle"].astype(float)
-    df["sunset_angle"] = df["sunset_angle"].astype(float)
-    df["noon_angle"] = df["noon_angle"].astype(float)
-    df["sun_distance"] = df["sun_distance"].astype(float)
-
-    df2 = df.loc[df.index.repeat(2)].reset_index(drop=True)
-    df2.loc[df2.index[:-1], "date"] = df2["date"].iloc[1:].values
-    df2.loc[df2.index[-1], "date"] += datetime.timedelta(days=1)
 
+def step_frames(df):
+    """ The table of one site, and the same table with every row twice, each
+    pair spanning one day, for step-like curves, as used by plot_sun_graph.
+    """
+    df = df.reset_index(drop=True)
+    df2 = df.iloc[np.repeat(np.arange(len(df)), 2)].reset_index(drop=True)
+    dates = df2["date"].to_numpy(copy=True)
+    dates[:-1] = dates[1:]
+    dates[-1] += np.timedelta64(1, "D")
+    df2["date"] = dates
     return df, df2
 
 
+def model_tables(
+    latitudes, longitudes=None, utc_offset=0.0, year=2025, sites=None,
+    eps=23.44, ecc=0.0167, gam=12.93, offset=2.5, n_year=365.2422,
+):
+    """ Sun tables of the analemma model, with the columns of load_data, for
+    all days of a year at several sites. The Sun position is solved once per
+    day at mean noon, and the rising and setting times of each altitude of
+    TWILIGHTS follow from the hour angle, for all sites at once.
+    Args:
+        latitudes (np.ndarray): latitudes of the sites, in degrees
+        longitudes (np.ndarray, optional): longitudes of the sites, in degrees
+            east, defaults to the meridian of the time zone
+        utc_offset (float, optional): time zone, in hours
+        year (int, optional): civil year of the dates
+        sites (list, optional): distinct site names, one per latitude,
+            defaults to the latitudes (prefixed by their index if two of
+            them have the same label)
+        eps, ecc, gam (float, optional): obliquity, eccentricity and winter
+            solstice to perihelion angle, in degrees
+        offset (float, optional): year start to perihelion, in days
+        n_year (float, optional): mean solar days per year
+
+    Returns:
+        df (pd.DataFrame): one row per site and day, sites one after the
+            other, with the columns "site" and "latitude" first, and times
+            in minutes of the time zone (no daylight saving time).
+    """
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))
+    if longitudes is None:
+        longitudes = np.full(latitudes.shape, 15.0 * utc_offset)
+    longitudes = np.broadcast_to(np.asarray(longitudes, dtype=float), latitudes.shape)
+    if sites is None:
+        sites = [f"{lat:.2f}" for lat in latitudes]
+        if len(set(sites)) < len(sites):
+            sites = [f"{k}: {lat:.2f}" for k, lat in enumerate(latitudes)]
+    elif len(sites) != latitudes.size or len(set(sites)) < len(sites):
+        raise ValueError("sites must be distinct names, one per latitude")
+
+    dates = np.arange(
+        np.datetime64(f"{year}-01-01"), np.datetime64(f"{year + 1}-01-01")
+    )
+    days = np.arange(dates.size)
+    # Planet-Sun vector at the mean noon of each day, |x| = r in AU
+    M = 2 * np.pi * (days + 0.5) / n_year
+    x1, x2, x3 = solve_analemma(
+        np.deg2rad(eps), ecc, np.deg2rad(gam), M, offset=offset / n_year
+    )
+    r = np.sqrt(x1 * x1 + x2 * x2 + x3 * x3)
+    sin_dec = x3 / r
+    cos_dec = np.sqrt(1 - sin_dec * sin_dec)
+    dec = np.arcsin(sin_dec)
+    mean_noon = 12 * 60 + 60 * utc_offset - 4 * longitudes[:, None]
+    noon = mean_noon + np.arctan2(x2, x1) / (2 * np.pi) * 24 * 60
+
+    phi = np.deg2rad(latitudes)[:, None]
+    sin_phi, cos_phi = np.sin(phi), np.cos(phi)
+    columns = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for (start, end), altitude in TWILIGHTS.items():
+            sin_h = np.sin(np.deg2rad(altitude))
+            # Hour angle of the altitude: 0 if never reached (polar night),
+            # half a day if never left (polar day)
+            cos_H = (sin_h - sin_phi * sin_dec) / (cos_phi * cos_dec)
+            H = np.arccos(np.clip(cos_H, -1.0, 1.0)) / (2 * np.pi) * 24 * 60
+            columns[start], columns[end] = noon - H, noon + H
+            if start == "sunrise":
+                # Azimuth of sunrise from the north, NaN without sunrise
+                cos_A = sin_dec - sin_phi * sin_h
+                cos_A /= cos_phi * np.cos(np.deg2rad(altitude))
+                azimuth = np.rad2deg(np.arccos(np.clip(cos_A, -1.0, 1.0)))
+                azimuth[~(np.abs(cos_H) <= 1.0)] = np.nan
+
+    shape = (latitudes.size, dates.size)
+    df = pd.DataFrame(
+        {
+            "site": pd.Categorical(np.repeat(sites, dates.size), categories=sites),
+            "latitude": np.repeat(latitudes, dates.size),
+            "sunrise": columns["sunrise"].ravel(),
+            "sunrise_angle": azimuth.ravel(),
+            "sunset": columns["sunset"].ravel(),
+            "sunset_angle": 360 - azimuth.ravel(),
+            "astr_start": columns["astr_start"].ravel(),
+            "astr_end": columns["astr_end"].ravel(),
+            "naut_start": columns["naut_start"].ravel(),
+            "naut_end": columns["naut_end"].ravel(),
+            "civ_start": columns["civ_start"].ravel(),
+            "civ_end": columns["civ_end"].ravel(),
+            "noon": np.broadcast_to(noon, shape).ravel(),
+            "noon_angle": (90 - np.abs(np.rad2deg(phi - dec))).ravel(),
+            "sun_distance": np.broadcast_to(AU * r, shape).ravel(),
+            "date": np.tile(dates, latitudes.size).astype("datetime64[us]"),
+        }
+    )
+    return df
+
+
 def format_hour(x, pos):
     h = int(x) // 60
     # m = int(x) % 60
@@ -86,7 +303,21 @@ def set_ax_x(ax):
     return
 
 
-def plot_sun_graph(df, df2):
+def plot_sun_graph(
+    df, df2, dst_days=(88, 298), noon_export="./Analemma/noon_Perdido.txt",
+    tz="CET",
+):
+    """ Sun graph of one site: day, twilights and night over the year, then
+    the smoothed solar noon and the length of solar days.
+    Args:
+        df, df2 (pd.DataFrame): duplicated and single tables of the site, see
+            step_frames
+        dst_days (tuple, optional): first and last days of daylight saving
+            time in the tables, None if the times do not have it (model_tables)
+        noon_export (str, optional): file for the noon shift every 7 days,
+            nothing written if empty
+        tz (str, optional): time zone label of the noon
+    """
     fig, axs = plt.subplots(
         3,
         1,
@@ -135,8 +366,10 @@ def plot_sun_graph(df, df2):
     tu = np.array(t4[2:]) + 24 * 60
     td = np.array(t5[:-2])
     midnight = (tu + td) / 2.0 - 24 * 60
-    midnight[[174, 175]] -= 30
-    midnight[[594, 595]] += 30
+    if dst_days is not None:
+        # Midnights across the clock change, from duplicated rows
+        midnight[[2 * dst_days[0] - 2, 2 * dst_days[0] - 1]] -= 30
+        midnight[[2 * dst_days[1] - 2, 2 * dst_days[1] - 1]] += 30
 
     ax.plot(x, (t4 + t5) * 0.5, color="white", lw=0.5)  # , label="Noon")
     ax.plot(x[2:], midnight, color="k", lw=0.5)  # , label="Midnight")
@@ -152,27 +385,27 @@ def plot_sun_graph(df, df2):
         ncol=5,
         columnspacing=1.75,
     )
-    ax.set_xlim(
-        datetime.datetime(2025, 1, 1, 0, 0, 0),
-        datetime.datetime(2025, 12, 31, 23, 59, 59),
-    )
+    ax.set_xlim(x.iloc[0], x.iloc[-1] - datetime.timedelta(seconds=1))
 
-    s1, s2 = 88, 298
+    n_days = len(df2)
     noon = (df2["sunrise"] + df2["sunset"]) / 2.0
-    noon[s1:s2] -= 60
-    spline = UnivariateSpline(np.arange(365), noon, s=15.0)
-    noon_smooth = spline(np.arange(365))
+    if dst_days is not None:
+        s1, s2 = dst_days
+        noon[s1:s2] -= 60
+    spline = UnivariateSpline(np.arange(n_days), noon, s=15.0)
+    noon_smooth = spline(np.arange(n_days))
     length = np.diff(noon_smooth) + 24 * 60
     mean_noon = np.mean(noon_smooth)
-    np.savetxt(
-        "./Analemma/noon_Perdido.txt", np.c_[
-            np.arange(365), noon_smooth - mean_noon
-        ][::7]
-    )
+    if noon_export:
+        np.savetxt(
+            noon_export, np.c_[
+                np.arange(n_days), noon_smooth - mean_noon
+            ][::7]
+        )
 
     ax = axs[1]
     ax.axhline(mean_noon, color="C1", lw=0.5)
-    ax.plot(df2["date"], noon_smooth, color="C1", lw=1.5, label="Noon (CET)")
+    ax.plot(df2["date"], noon_smooth, color="C1", lw=1.5, label=f"Noon ({tz})")
     ax.set_ylim(noon.min() - 10, noon.max() + 10)
     ax.tick_params(axis="y", length=3, width=0.5, direction="in", pad=-30)
     ax.yaxis.set_major_formatter(ticker.FuncFormatter(format_minutes))
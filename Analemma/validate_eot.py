@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from draw_analemma import solve_analemma
+from equation_time import approx_noon_shift, solve_noon_shift
+
+# Earth parameters of plot_noon_tilt: year starts 2.5 days before perihelion
+EPS, ECC, GAM, N, OFFSET = 23.44, 0.0167, 12.93, 365, 2.5
+MINUTES = 24 * 60
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REFERENCES = {
+    "perdido": os.path.join(HERE, "noon_Perdido.txt"),
+    "imcce": os.path.join(HERE, "data_EoT_IMCCE_BDL.txt"),
+}
+
+
+def _solve_noon():
+    M, shift = solve_noon_shift(
+        ECC, np.cos(np.deg2rad(EPS)), np.deg2rad(GAM), N, OFFSET
+    )
+    return M, shift * N / (2 * np.pi) * MINUTES
+
+
+def _approx_noon(order):
+    def model():
+        M, approx1, approx2 = approx_noon_shift(
+            ECC, np.cos(np.deg2rad(EPS)), np.deg2rad(GAM), N, OFFSET
+        )
+        shift = approx1 if order == 1 else approx2
+        return M, shift * N / (2 * np.pi) * MINUTES
+    return model
+
+
+def _analemma_noon():
+    # Hour angle of the Sun at mean noon, converted to minutes
+    M = np.linspace(0, 2 * np.pi, N, endpoint=False) + np.pi / N
+    x1, x2, _ = solve_analemma(
+        np.deg2rad(EPS), ECC, np.deg2rad(GAM), M, offset=OFFSET / N
+    )
+    return M, np.arctan2(x2, x1) / (2 * np.pi) * MINUTES
+
+
+MODELS = {
+    "solve_noon_shift": _solve_noon,
+    "approx_noon_shift_1": _approx_noon(1),
+    "approx_noon_shift_2": _approx_noon(2),
+    "solve_analemma": _analemma_noon,
+}
+
+
+def model_error(model, reference):
+    """ Errors of a model against a reference, in minutes.
+    Args:
+        model (callable): returns the mean anomalies of mean noons and the
+            noon shifts, in minutes
+        reference (np.ndarray): days of year and noon shifts in minutes,
+            shape (n, 2)
+
+    Returns:
+        max_err, rms_err (float): errors of the model interpolated
+            (periodically) at the reference days.
+    """
+    M, shift = model()
+    days = M * N / (2 * np.pi)
+    err = np.interp(reference[:, 0], days, shift, period=N) - reference[:, 1]
+    return float(np.amax(np.abs(err))), float(np.sqrt(np.mean(err * err)))
+
+
+def run(repeat=5):
+    references = {name: np.loadtxt(path) for name, path in REFERENCES.items()}
+    results = []
+    for model_name, model in MODELS.items():
+        for ref_name, reference in references.items():
+            with redirect_stdout(io.StringIO()):
+                max_err, rms_err = model_error(model, reference)
+                times = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    model_error(model, reference)
+                    times.append(time.perf_counter() - start)
+            results.append(
+                dict(model=model_name, reference=ref_name, max_err=max_err,
+                     rms_err=rms_err, time=min(times))
+            )
+            print(
+                f"{model_name:>20s} {ref_name:>8s} max {max_err:7.3f} min "
+                f"rms {rms_err:7.3f} min {1e3 * min(times):9.3f} ms"
+            )
+    meta = dict(
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        date=time.strftime("%Y-%m-%d %H:%M:%S"),
+    )
+    return dict(meta=meta, results=results)
+
+
+def compare(current, baseline, atol=1e-3, threshold=1.25, min_time=1e-3):
+    """ List the cases less accurate than the baseline (by more than atol
+    minutes) or slower than `threshold` times the baseline, with the error
+    increase or the time ratio. Slowdowns below `min_time` seconds are
+    ignored, being within timing noise for the fastest models.
+    """
+    def key(r):
+        return r["model"], r["reference"]
+
+    reference = {key(r): r for r in baseline["results"]}
+    regressions = []
+    for r in current["results"]:
+        ref = reference.get(key(r))
+        if ref is None:
+            continue
+        for field in ("max_err", "rms_err"):
+            if r[field] > ref[field] + atol:
+                regressions.append((*key(r), field, r[field] - ref[field]))
+        slower = r["time"] > threshold * ref["time"]
+        if ref["time"] > 0 and slower and r["time"] - ref["time"] > min_time:
+            regressions.append((*key(r), "time", r["time"] / ref["time"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Equation of time validation")
+    parser.add_argument("--output", default="validate_eot.json")
+    parser.add_argument("--baseline", default="", help="baseline json file")
+    parser.add_argument("--atol", type=float, default=1e-3, help="in minutes")
+    parser.add_argument("--threshold", type=float, default=1.25)
+    parser.add_argument("--min-time", type=float, default=1e-3, help="in s")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    current = run(args.repeat)
+    with open(args.output, "w") as f:
+        json.dump(current, f, indent=1)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(
+            current, baseline, args.atol, args.threshold, args.min_time
+        )
+        for model, ref, field, value in regressions:
+            print(f"REGRESSION {model} vs {ref}: {field} {value:.3g}")
+        if regressions:
+            sys.exit(1)
+        print("No regression")